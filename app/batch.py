@@ -0,0 +1,345 @@
+"""Non-interactive batch mode, commands are read from script file or stdin.
+
+Every line is one command with inline arguments quoted like in shell:
+
+    add "John Smith" 0501234567
+    add-email "John Smith" john@example.com
+    note-add groceries "milk, bread"
+
+Empty lines and lines starting with '#' are skipped. Every command prints
+one json line {"line", "command", "ok", "result"} or {..., "ok": false, "error"}.
+"""
+
+import inspect
+import json
+import shlex
+from functools import lru_cache
+from app.classes.metrics import metrics
+from app.classes.record import Record
+from app.classes.contacts_import import import_contacts
+from app.classes.notes_io import write_notes
+from app.classes.notes_indexes import NotesSearchIndex
+from app.functions import search_by_phone
+
+
+# Names offered when contact is not found
+SUGGESTIONS = 5
+# Record methods giving phone or email, the value is their last argument
+UNIQUE_METHODS = {"add_phone": "phone", "edit_phone": "phone", "add_email": "email"}
+
+
+def _contact(book, name: str) -> Record:
+    record = book.find(name)
+    if record is None:
+        similar = [found.name.value for found, _ in book.find_fuzzy(name, limit=SUGGESTIONS)]
+        hint = f", did you mean: {', '.join(similar)}?" if similar else ""
+        raise ValueError(f"Contact '{name}' not found{hint}")
+    return record
+
+
+def _note(notes, title: str) -> dict:
+    if title not in notes.notes:
+        raise ValueError(f"Note '{title}' does not exist")
+    return {"title": title, **notes.notes[title]}
+
+
+def _required(value: str, field: str) -> str:
+    # Empty value would make notes manager ask for it on stdin
+    if not value.strip():
+        raise ValueError(f"Note {field} can not be empty")
+    return value
+
+
+def _duplicates(duplicates: dict) -> list:
+    return [{"field": field, "value": value, "names": names} for (field, value), names in duplicates.items()]
+
+
+def add_contact(book, notes, name, *phones):
+    """Add new contact with phones, other contacts having them are handled by duplicates policy"""
+    if len(name) <= 3:
+        raise ValueError("Name must be more than 3 chars")
+    if book.find(name):
+        raise ValueError(f"Contact '{name}' already exists")
+    record = Record(name)
+    for phone in phones:
+        record.add_phone(phone)
+    added, duplicates = book.add_unique(record)
+    if not duplicates:
+        return record
+    result = {**added.to_dict(), "duplicates": _duplicates(duplicates)}
+    if added is not record:
+        result["merged"] = name
+    return result
+
+
+def edit_contact(method: str):
+    """Command calling record method with the rest of arguments"""
+    def command(book, notes, name, *args):
+        record = _contact(book, name)
+        getattr(record, method)(*args)
+        if method in UNIQUE_METHODS and args:
+            duplicates = book.duplicates_of(record, {UNIQUE_METHODS[method]: (args[-1],)})
+            if duplicates:
+                return {**record.to_dict(), "duplicates": _duplicates(duplicates)}
+        return record
+    return command
+
+
+def remove_contact(book, notes, name):
+    """Remove contact"""
+    _contact(book, name)
+    book.delete(name)
+    return {"name": name}
+
+
+def find_fuzzy(book, notes, query, max_distance="2", limit="10"):
+    """Contacts with names close to query, closest first"""
+    return [
+        {**record.to_dict(), "distance": distance}
+        for record, distance in book.find_fuzzy(query, int(max_distance), int(limit))
+    ]
+
+
+def all_contacts(book, notes, sort_key="name"):
+    """All contacts sorted by name or birthday"""
+    return [record for page in book.iter_pages(sort_key=sort_key) for record in page]
+
+
+def upcoming_birthdays(book, notes, period="7"):
+    """Birthdays in next period days grouped by date"""
+    return [
+        {"date": day.isoformat(), "names": names}
+        for day, names in book.get_upcoming_birthdays(int(period))
+    ]
+
+
+def birthday_stats(book, notes):
+    """Birthdays per month and weekday, ages and round birthdays of this quarter"""
+    report = book.birthday_stats()
+    report["round"] = [{**item, "date": item["date"].isoformat()} for item in report["round"]]
+    return report
+
+
+def import_contacts_file(book, notes, file_path):
+    """Import contacts from CSV or vCard file"""
+    imported, errors, warnings = import_contacts(book, file_path)
+    return {
+        "imported": imported,
+        "errors": [{"line": line, "error": error} for line, error in errors],
+        "duplicates": [{"line": line, "warning": warning} for line, warning in warnings],
+    }
+
+
+def add_note(book, notes, title, content=""):
+    """Add new note"""
+    if _required(title, "title") in notes.notes:
+        raise ValueError(f"Note '{title}' already exists")
+    notes.add_note(title, content)
+    return _note(notes, title)
+
+
+def edit_note(book, notes, title, content):
+    """Replace note content"""
+    _note(notes, title)
+    notes.edit_note(title, content)
+    return _note(notes, title)
+
+
+def delete_note(book, notes, title):
+    """Delete note without confirmation"""
+    _note(notes, title)
+    notes.delete_note(title, confirm="yes")
+    return {"title": title}
+
+
+def search_notes(book, notes, query, limit="10"):
+    """Ranked notes search"""
+    return [
+        {"title": title, "score": round(score, 4),
+         "snippet": NotesSearchIndex.snippet(notes.notes[title]["content"], query)}
+        for title, score in notes.search(query, int(limit))
+    ]
+
+
+def add_tag(book, notes, title, tag):
+    """Add tag to note"""
+    if _required(tag, "tag") in _note(notes, title)["tags"]:
+        raise ValueError(f"Note '{title}' already has tag '{tag}'")
+    notes.add_tag(title, tag)
+    return _note(notes, title)
+
+
+def crypt_note(encrypt: bool):
+    """Command encrypting or decrypting one note"""
+    def command(book, notes, title):
+        if bool(_note(notes, title).get("encrypted")) == encrypt:
+            raise ValueError(f"Note '{title}' is already {'encrypted' if encrypt else 'decrypted'}")
+        message = notes.encrypt_note(title) if encrypt else notes.decrypt_note(title)
+        if bool(notes.notes[title].get("encrypted")) != encrypt:
+            raise ValueError(message)
+        return _note(notes, title)
+    return command
+
+
+def crypt_all(encrypt: bool):
+    """Command encrypting or decrypting notes matching tag query"""
+    def command(book, notes, tag_query=""):
+        done, failed = notes.crypt_all(tag_query, encrypt)
+        return {"done": done, "failed": failed}
+    return command
+
+
+def import_notes(book, notes, file_path, policy="overwrite"):
+    """Import notes from JSON/JSONL/CSV/TXT file"""
+    imported, skipped = notes.import_from_file(file_path, policy)
+    return {"imported": imported, "skipped": skipped}
+
+
+def export_notes(book, notes, file_path):
+    """Export notes to JSON/JSONL/CSV/TXT file"""
+    return {"exported": write_notes(file_path, notes.notes.items())}
+
+
+def dedupe(book, notes):
+    """Phones and emails which several contacts have"""
+    return [{"field": field, "value": value, "names": names} for field, value, names in book.find_duplicates()]
+
+
+def stats(book, notes, file_path=None):
+    """Latency percentiles of commands, saved to json file if file_path is given"""
+    if not metrics.enabled:
+        raise ValueError("Metrics are off, start with --metrics or PIPBOY_METRICS=1")
+    if file_path:
+        metrics.dump(file_path)
+    return metrics.summary()
+
+
+COMMANDS = {
+    "hello": lambda book, notes: "How can I help you?",
+    "add": add_contact,
+    "add-phone": edit_contact("add_phone"),
+    "change-phone": edit_contact("edit_phone"),
+    "delete-phone": edit_contact("remove_phone"),
+    "add-email": edit_contact("add_email"),
+    "change-email": edit_contact("add_email"),
+    "delete-email": edit_contact("remove_email"),
+    "add-birthday": edit_contact("add_birthday"),
+    "change-birthday": edit_contact("add_birthday"),
+    "delete-birthday": edit_contact("remove_birthday"),
+    "add-address": edit_contact("add_address"),
+    "change-address": edit_contact("edit_address"),
+    "delete-address": edit_contact("remove_address"),
+    "remove-contact": remove_contact,
+    "show-contact": lambda book, notes, name: _contact(book, name),
+    "all": all_contacts,
+    "birthdays": upcoming_birthdays,
+    "birthday-stats": birthday_stats,
+    "find": lambda book, notes, query: book.find_by_query(query),
+    "find-phone": lambda book, notes, query: search_by_phone(book, query),
+    "find-fuzzy": find_fuzzy,
+    "import-contacts": import_contacts_file,
+    "dedupe": dedupe,
+    "note-add": add_note,
+    "note-show": lambda book, notes, title: _note(notes, title),
+    "note-edit": edit_note,
+    "note-delete": delete_note,
+    "note-search": search_notes,
+    "note-add-tag": add_tag,
+    "note-search-by-tag": lambda book, notes, query: sorted(notes.find_by_tags(query)),
+    "notes-tags": lambda book, notes: notes.tags(),
+    "note-encrypt": crypt_note(encrypt=True),
+    "note-decrypt": crypt_note(encrypt=False),
+    "notes-encrypt-all": crypt_all(encrypt=True),
+    "notes-decrypt-all": crypt_all(encrypt=False),
+    "notes-import": import_notes,
+    "notes-export": export_notes,
+    "notes-all": lambda book, notes: [{"title": title, **note} for title, note in notes.notes.items()],
+    "stats": stats,
+}
+
+
+# Commands which do not change book or notes, they may run side by side
+READ_COMMANDS = frozenset({
+    "hello", "show-contact", "all", "birthdays", "birthday-stats", "find", "find-phone", "find-fuzzy",
+    "dedupe", "note-show", "note-search", "note-search-by-tag", "notes-tags", "notes-export", "notes-all", "stats",
+})
+
+
+def to_json(result):
+    """Convert command result to json compatible data"""
+    if isinstance(result, Record):
+        return result.to_dict()
+    if isinstance(result, list):
+        return [to_json(item) for item in result]
+    return result
+
+
+def render(result) -> str:
+    """Render command result as tables like interactive mode does"""
+    from app.visualiser import show_contact_table, show_search_results_table
+
+    if isinstance(result, Record):
+        return show_contact_table(result)
+    if isinstance(result, list) and all(isinstance(item, Record) for item in result):
+        return show_search_results_table(result, "")
+    return json.dumps(to_json(result), ensure_ascii=False, indent=2)
+
+
+@lru_cache(maxsize=None)
+def _signature(command: str) -> inspect.Signature:
+    return inspect.signature(COMMANDS[command])
+
+
+def execute(book, notes, command: str, args: list):
+    """Run command with arguments, raise ValueError on unknown command or wrong arguments"""
+    if command not in COMMANDS:
+        raise ValueError(f"Invalid command '{command}'")
+    # Arguments are checked before the call, TypeError raised inside command is a bug, not a usage error
+    try:
+        _signature(command).bind(book, notes, *args)
+    except TypeError as e:
+        raise ValueError(f"Wrong arguments for '{command}': {e}") from e
+    with metrics.command(command):
+        return COMMANDS[command](book, notes, *args)
+
+
+def error_message(error: Exception) -> str:
+    """Message of error raised by command, unexpected errors are prefixed with their type"""
+    if isinstance(error, KeyError) and error.args:
+        return error.args[0]
+    if isinstance(error, (ValueError, OSError)):
+        return str(error)
+    return f"{type(error).__name__}: {error}"
+
+
+def run_command(book, notes, line: str):
+    """Run one script line, return (command, result), raise ValueError on bad command"""
+    try:
+        command, *args = shlex.split(line)
+    except ValueError as e:
+        raise ValueError(f"Can not parse line: {e}") from e
+    return command, execute(book, notes, command, args)
+
+
+def run_script(lines, book, notes, tables=False, out=None) -> int:
+    """Run script lines one by one, print result of every command, return number of failed commands"""
+    failed = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        output = {"line": number, "command": line.split(maxsplit=1)[0]}
+        book.refresh()
+        try:
+            output["command"], result = run_command(book, notes, line)
+        except Exception as e:
+            failed += 1
+            output.update(ok=False, error=error_message(e))
+            print(json.dumps(output, ensure_ascii=False), file=out, flush=True)
+            continue
+        if tables:
+            print(render(result), file=out, flush=True)
+        else:
+            output.update(ok=True, result=to_json(result))
+            print(json.dumps(output, ensure_ascii=False), file=out, flush=True)
+    return failed
@@ -1,28 +1,234 @@
 """Module providing AddressBook class declaration."""
 
-from collections import UserDict, defaultdict 
-from datetime import datetime, timedelta
+import os
+from collections import Counter, UserDict, defaultdict
+from datetime import datetime
+from functools import partial
 from app.classes.record import Record
-   
+from app.classes.snapshot import SnapshotRecords
+from app.classes.birthday_stats import BirthdayArray, birthday_report
+from app.classes.indexes import (
+    TrigramIndex, PhoneIndex, BirthdayIndex, SortedIndex, NameIndex, FuzzyNameIndex, UniqueIndex,
+    name_sort_key, birthday_sort_key, gc_paused, normalize_unique, record_phones, record_emails
+)
+
+# What happens to phone or email other contact already has, like PIPBOY_DUPLICATES=reject
+DUPLICATES_ENV = "PIPBOY_DUPLICATES"
+DUPLICATE_POLICIES = ("reject", "warn", "merge")
+UNIQUE_FIELDS = {"phone": record_phones, "email": record_emails}
+
+
+def duplicates_policy() -> str:
+    """Policy from environment, unknown values fall back to warn"""
+    policy = os.environ.get(DUPLICATES_ENV, "warn")
+    return policy if policy in DUPLICATE_POLICIES else "warn"
+
+
+def describe_duplicates(duplicates: dict) -> str:
+    return "; ".join(
+        f"{field} {value} belongs to {', '.join(names)}" for (field, value), names in duplicates.items()
+    )
+
+
+def merge_target(duplicates: dict) -> str:
+    """Name of contact having most of duplicated values"""
+    return Counter(name for names in duplicates.values() for name in names).most_common(1)[0][0]
+
+
+class DuplicateError(ValueError):
+    """Phone or email belongs to other contact and policy is reject"""
+
+    def __init__(self, duplicates: dict):
+        super().__init__(describe_duplicates(duplicates))
+        self.duplicates = duplicates
+
 
 class AddressBook(UserDict):
     """AddressBook class for all address book data"""
 
+    # Indexes are built on first use and then kept in sync with records
+    INDEXES = {
+        "search": TrigramIndex,
+        "phone": PhoneIndex,
+        "birthday": BirthdayIndex,
+        "birthday:array": BirthdayArray,
+        "names": NameIndex,
+        "fuzzy": FuzzyNameIndex,
+        "sort:name": partial(SortedIndex, name_sort_key),
+        "sort:birthday": partial(SortedIndex, birthday_sort_key),
+        "unique:phone": partial(UniqueIndex, record_phones),
+        "unique:email": partial(UniqueIndex, record_emails),
+    }
+    SORT_KEYS = ("name", "birthday")
+
     def __init__(self):
         super().__init__()
+        self.journal = None
+        self.generation = 0  # last journal generation merged into saved snapshot
+        self.changes = 0  # counter of changes, autosave compares it with saved one
+        self.duplicates = duplicates_policy()
+        self._indexes = {}
+
+    def __getstate__(self):
+        return {"data": self.data, "generation": self.generation}
+
+    def __setstate__(self, state):
+        self.generation = 0
+        self.changes = 0
+        self.__dict__.update(state)
+        self.journal = None
+        self.duplicates = duplicates_policy()
+        self._indexes = {}
+        if isinstance(self.data, SnapshotRecords):
+            # Records are attached to book when decoded
+            self.data.book = self
+            for record in self.data._records.values():
+                record._book = self
+        else:
+            for record in self.data.values():
+                record._book = self
 
     def __str__(self):
         if len(self.data) == 0:
             return "Записи відсутні"
-        to_return = "Записи"
-        for record in self.data.values():
-            to_return += f"\n{record}"
-        return to_return
+        return "\n".join(["Записи", *(str(record) for record in self.data.values())])
     
 
     def add_record(self, record: Record) -> None:
         self.data[record.name.value] = record
+        record._book = self
+        self._record_changed(record)
+
+    def add_records(self, records: list) -> None:
+        """Add many records at once, journal gets them as one write"""
+        for record in records:
+            self.data[record.name.value] = record
+            record._book = self
+            for index in self._indexes.values():
+                index.add(record)
+        self.changes += 1
+        if self.journal and records:
+            self.journal.log_puts(records)
+
+    def add_unique(self, record: Record) -> tuple:
+        """Add new record applying duplicates policy.
+
+        Returns (record, duplicates), with merge policy record is the
+        contact new one was merged into. Raises DuplicateError with reject policy.
+        """
+        duplicates = self.duplicates_of(record)
+        if duplicates and self.duplicates == "reject":
+            raise DuplicateError(duplicates)
+        if duplicates and self.duplicates == "merge":
+            target = self.data[merge_target(duplicates)]
+            target.merge(record)
+            return target, duplicates
+        self.add_record(record)
+        return record, duplicates
+
+    def add_records_unique(self, records: list) -> list:
+        """Add many new records applying duplicates policy, records are checked against each other too.
+
+        Returns (record, duplicates, merged into name or None) of records having
+        duplicates, with reject policy they are not added.
+        """
+        added, found = {}, []
+        pending = {field: {} for field in UNIQUE_FIELDS}  # values of records added by this call
+        for record in records:
+            duplicates = self.duplicates_of(record, pending=pending)
+            target = None
+            if duplicates:
+                target = merge_target(duplicates) if self.duplicates == "merge" else None
+                found.append((record, duplicates, target))
+                if self.duplicates == "reject":
+                    continue
+            if target in added:
+                # Merged data is added together with record of this call
+                added[target].merge(record)
+                record = added[target]
+            elif target is not None:
+                self.data[target].merge(record)
+                continue
+            added[record.name.value] = record
+            for field, values in UNIQUE_FIELDS.items():
+                for value in values(record):
+                    pending[field].setdefault(normalize_unique(value), record.name.value)
+        self.add_records(list(added.values()))
+        return found
+
+    def duplicates_of(self, record: Record, fields: dict = None, pending: dict = None) -> dict:
+        """Return {(field, value): names} for phones and email of record other contacts have.
+
+        fields maps field to values checked instead of record ones, like phone
+        before it is added, pending maps field to {value: name} of records not in book yet.
+        """
+        name = record.name.value
+        if fields is None:
+            fields = {field: values(record) for field, values in UNIQUE_FIELDS.items()}
+        duplicates = {}
+        for field, values in fields.items():
+            for value in values:
+                names = self._owners(field, value)
+                if pending and normalize_unique(value) in pending[field]:
+                    names.add(pending[field][normalize_unique(value)])
+                names.discard(name)
+                if names:
+                    duplicates[field, value] = sorted(names)
+        return duplicates
 
+    def _owners(self, field: str, value: str) -> set:
+        """Names of records which have phone or email value"""
+        return self._index(f"unique:{field}").find(value)
+
+    def _check_unique(self, record: Record, field: str, value: str) -> None:
+        """Called by record before it gets phone or email, only reject policy stops the change"""
+        if self.duplicates == "reject":
+            duplicates = self.duplicates_of(record, {field: (value,)})
+            if duplicates:
+                raise DuplicateError(duplicates)
+
+    def find_duplicates(self) -> list:
+        """Return (field, value, names) of phones and emails several contacts have"""
+        return sorted(
+            (field, value, sorted(names))
+            for field in UNIQUE_FIELDS
+            for value, names in self._index(f"unique:{field}").shared()
+        )
+
+    def close(self) -> None:
+        """Finish journal and release snapshot file the book is read from, book is not used after it"""
+        if self.journal:
+            self.journal.close()
+        if isinstance(self.data, SnapshotRecords):
+            self.data.close()
+
+    def refresh(self) -> None:
+        """Apply changes saved by other processes sharing the book file"""
+        if self.journal:
+            self.journal.refresh()
+
+    def _index(self, key: str):
+        """Return index by key, building it from records on first use"""
+        index = self._indexes.get(key)
+        if index is None:
+            index = self.INDEXES[key]()
+            if hasattr(index, "build"):
+                # Bulk build, adding records one by one keeps sorted structures sorted on every add
+                with gc_paused():
+                    index.build(self.data.values())
+            else:
+                for record in self.data.values():
+                    index.add(record)
+            self._indexes[key] = index
+        return index
+
+    def _record_changed(self, record: Record) -> None:
+        """Called by record after any change of its data"""
+        for index in self._indexes.values():
+            index.add(record)
+        self.changes += 1
+        if self.journal:
+            self.journal.log_put(record)
 
     def find(self, name: str) -> str:
         if name in self.data:
@@ -33,55 +239,82 @@ class AddressBook(UserDict):
     def delete(self, name: str) -> None:
         if name not in self.data:
             raise KeyError(f"Record for name '{name}' not found")
-        del self.data[name]
+        self.data.pop(name)._book = None
+        for index in self._indexes.values():
+            index.remove(name)
+        self.changes += 1
+        if self.journal:
+            self.journal.log_delete(name)
+
+    def get_page(self, cursor=None, page_size: int = 20, sort_key: str = "name") -> tuple:
+        """Return (records, next_cursor) of one page sorted by sort_key.
+
+        Pass next_cursor to get the following page, it is None on the last page.
+        """
+        if sort_key not in self.SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort_key}'")
+        if sort_key == "name" and isinstance(self.data, SnapshotRecords) and "sort:name" not in self._indexes:
+            # Snapshot is sorted by name already, cursor is (name, name) like the one of the index
+            names, more = self.data.page(cursor[1] if cursor else None, page_size)
+            next_cursor = (names[-1], names[-1]) if more else None
+        else:
+            names, next_cursor = self._index(f"sort:{sort_key}").page(cursor, page_size)
+        return [self.data[name] for name in names], next_cursor
+
+    def iter_pages(self, page_size: int = 20, sort_key: str = "name"):
+        """Yield lists of records page by page"""
+        cursor = None
+        while True:
+            records, cursor = self.get_page(cursor, page_size, sort_key)
+            if records:
+                yield records
+            if cursor is None:
+                break
 
     def show_upcoming_birthdays(self, period = 7) -> str:
-        today = datetime.today().date()
+        upcoming = self.get_upcoming_birthdays(period)
+        if not upcoming:
+            return "No birthdays for this period"
+        return "".join(
+            f"{day.strftime('%A')} ({day.strftime('%d.%m.%Y')}): {', '.join(names)}\n"
+            for day, names in upcoming
+        )
+
+    def get_upcoming_birthdays(self, period = 7) -> list:
+        """Return list of (date, names) for birthdays in next period days, ordered by date"""
         congratulation_dict = defaultdict(list)
-        date_start = today 
-        date_end = date_start + timedelta(days=period-1)
-    
-        for username, user in self.data.items():
-            if user.birthday:
-                user_birthday = user.birthday.value.replace(year=today.year)
-                user_birthday = user_birthday.replace(year=today.year + 1) if today > user_birthday else user_birthday
-                
-                if date_start <= user_birthday <= date_end:
-                    day_label = f"{user_birthday.strftime('%A')} ({user_birthday.strftime('%d.%m.%Y')})"
-                    congratulation_dict[day_label].append(username)
-
-
-        output = ''
-        for day, names in sorted(congratulation_dict.items()):
-            output += f"{day}: {', '.join(names)}\n"
-        
-        output = "No birthdays for this period" if output == '' else output
-        return output
-    
-    def find_by_query(self, query: str) -> str:
-        """Search query data in any field"""
-        query = query.lower()
-        results = []
+        for username, user_birthday in self._birthdays_in_period(period):
+            congratulation_dict[user_birthday].append(username)
+        return sorted(congratulation_dict.items())
 
-        for record in self.data.values():
-            if query in record.name.value.lower():
-                results.append(record)
-                continue
+    def _birthdays_in_period(self, period: int):
+        """Yield (name, date) for birthdays celebrated in next period days"""
+        return self._index("birthday").in_period(datetime.today().date(), period)
 
-            if record.email and query in record.email.value.lower():
-                results.append(record)
-                continue
+    def birthday_stats(self, today=None) -> dict:
+        """Birthdays per month and weekday, ages and round birthdays of this quarter"""
+        return birthday_report(self._index("birthday:array"), today or datetime.today().date())
 
-            if any(query in phone.value for phone in record.phones):
-                results.append(record)
-                continue
+    def complete_names(self, prefix: str) -> list:
+        """Contact names starting with prefix, for tab completion"""
+        return self._index("names").complete(prefix)
 
-            if any(query in address.address.lower() for address in record.addresses.values()):
-                results.append(record)
-                continue
+    def find_fuzzy(self, query: str, max_distance: int = 2, limit: int = 10) -> list:
+        """Return (record, distance) of contacts with names close to query, closest first"""
+        return [(self.data[name], distance) for name, distance in self._index("fuzzy").search(query, max_distance, limit)]
 
-            if record.birthday and query in record.birthday.__str__().lower():
-                results.append(record)
-                continue
+    def find_by_query(self, query: str) -> list:
+        """Search query data in any field"""
+        return [self.data[name] for name in self._index("search").search(query)]
+
+    def find_by_phone(self, phone: str) -> list:
+        """Return records which have exactly this phone"""
+        return [self.data[name] for name in sorted(self._index("phone").find(phone))]
+
+    def find_by_phone_prefix(self, prefix: str) -> list:
+        """Return records with phone starting with prefix"""
+        return [self.data[name] for name in self._index("phone").starts_with(prefix)]
 
-        return results
\ No newline at end of file
+    def find_by_phone_suffix(self, suffix: str) -> list:
+        """Return records with phone ending with suffix"""
+        return [self.data[name] for name in self._index("phone").ends_with(suffix)]
@@ -0,0 +1,92 @@
+"""Module providing background autosave of changed data."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds without new changes before changed data is saved
+AUTOSAVE_DELAY = 2.0
+# Data changed all the time is still saved this often
+AUTOSAVE_MAX_DELAY = 30.0
+# Held by commands while they change data, autosave takes it only to copy data
+COMMAND_LOCK = threading.RLock()
+
+
+@contextmanager
+def waiting_for_input(lock=COMMAND_LOCK):
+    """Release lock held by this thread while user types, so prompts of a command do not stall autosave"""
+    try:
+        lock.release()
+    except RuntimeError:  # Not held, prompt is outside of command
+        yield
+        return
+    try:
+        yield
+    finally:
+        lock.acquire()
+
+
+class _Store:
+    def __init__(self, name: str, changes, save):
+        self.name = name
+        self.changes = changes
+        self.save = save
+        self.seen = self.saved = changes()
+        self.changed_at = self.dirty_since = None
+
+
+class AutoSaver:
+    """Thread saving stores some time after their last change.
+
+    Store is a function returning its change counter and a function saving
+    it. Commands changing data run holding `lock` and release it while they
+    wait for input, save functions take it only to copy data and write files
+    after releasing it, so neither side waits for the other for long.
+    """
+
+    def __init__(self, delay: float = AUTOSAVE_DELAY, max_delay: float = AUTOSAVE_MAX_DELAY):
+        self.delay = delay
+        self.max_delay = max(delay, max_delay)
+        self.lock = COMMAND_LOCK
+        self.last_error = None
+        self._stores = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name: str, changes, save) -> None:
+        """Watch store, save(lock) is called from saver thread when counter from changes() moved"""
+        self._stores.append(_Store(name, changes, save))
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop thread, unsaved changes are left for the final save"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.delay / 4):
+            self.check(time.monotonic())
+
+    def check(self, now: float) -> None:
+        """Save every store which was not changed for delay or is unsaved for max_delay"""
+        for store in self._stores:
+            count = store.changes()
+            if count != store.seen:
+                store.seen, store.changed_at = count, now
+                store.dirty_since = store.dirty_since or now
+            if count == store.saved:
+                continue
+            if now - store.changed_at < self.delay and now - store.dirty_since < self.max_delay:
+                continue
+            try:
+                store.save(self.lock)
+            except OSError as e:
+                # Kept dirty and tried again after delay
+                self.last_error = f"{store.name}: {e}"
+                store.changed_at = store.dirty_since = now
+                continue
+            store.saved, store.dirty_since = count, None
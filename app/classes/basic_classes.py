@@ -2,13 +2,45 @@
 
 from datetime import datetime
 import re
+import sys
+from app.classes.metrics import metrics
 
-class Field:
+
+class Slotted:
+    """Base for slotted classes, restores pickles made when they had __dict__"""
+
+    __slots__ = ()
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1] or {}
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
+def _restore_field(cls, value):
+    """Unpickle field saved by Field.__reduce__"""
+    return cls.from_valid(value)
+
+
+class Field(Slotted):
     """Basic Class representing field"""
 
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
+    def __reduce__(self):
+        return _restore_field, (self.__class__, self.value)
+
+    @classmethod
+    def from_valid(cls, value):
+        """Build field from already validated value skipping validation"""
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
     def __str__(self):
         return str(self.value)
 
@@ -16,30 +48,50 @@ class Field:
 class Name(Field):
     """Class representing a name field"""
 
+    __slots__ = ()
+
 
 class Phone(Field):
-    """Class representing a phone field"""
+    """Class representing a phone field, phone got from record is bound to it"""
+
+    __slots__ = ("_record",)
+    LENGTH = 10
 
     def __init__(self, number: str):
         super().__init__(self._is_valid_number(number))
+        self._record = None
+
+    @classmethod
+    def from_valid(cls, value, record=None):
+        phone = super().from_valid(value)
+        phone._record = record
+        return phone
 
     @staticmethod
+    @metrics.timed("validation")
     def _is_valid_number(number: str) -> str:
-        if len(number) != 10 or not number.isdigit():
+        if len(number) != Phone.LENGTH or not number.isdigit():
             raise ValueError("Wrong number format must be 10 digits")
         return number
 
     def update_number(self, new_value: str) -> None:
-        self.value = self._is_valid_number(new_value)
+        """Change number, in record the phone was got from too"""
+        new_value = self._is_valid_number(new_value)
+        if self._record is not None:
+            self._record.edit_phone(self.value, new_value)
+        self.value = new_value
 
 
 class Email(Field):
     """Class representing an email field"""
 
+    __slots__ = ()
+
     def __init__(self, email: str):
         super().__init__(self._is_valid_email(email))
 
     @staticmethod
+    @metrics.timed("validation")
     def _is_valid_email(email: str) -> str:
         pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
         if not re.match(pattern, email):
@@ -50,10 +102,13 @@ class Email(Field):
 class Birthday(Field):
     """Class representing a birthday field"""
 
+    __slots__ = ()
+
     def __init__(self, date: str):
         super().__init__(self._is_valid_birthday(date))
 
     @staticmethod
+    @metrics.timed("validation")
     def _is_valid_birthday(birthday: str) -> datetime.date:
         try:
             return datetime.strptime(birthday, "%d.%m.%Y").date()
@@ -64,12 +119,18 @@ class Birthday(Field):
         return f"{self.value.strftime('%d.%m.%Y')}"
 
 
-class Address:
+class Address(Slotted):
     """Class representing an address field"""
-    
+
+    __slots__ = ("label", "address")
+
     def __init__(self, label: str, address: str):
-        self.label = label
+        # Few distinct labels are shared by all records
+        self.label = sys.intern(label)
         self.address = address
 
+    def __reduce__(self):
+        return Address, (self.label, self.address)
+
     def __str__(self):
         return f"{self.label}: {self.address}"
@@ -0,0 +1,130 @@
+"""Module providing packed birthday array and whole book birthday reports."""
+
+from array import array
+from collections import Counter
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:  # Reports group birthdays with Counter
+    np = None
+
+# Ages are counted in buckets of this many years
+AGE_BUCKET = 10
+# Birthdays of ages divisible by this are round
+ROUND_AGE = 10
+
+
+def pack(day: date) -> int:
+    """Date as one int ordered like dates, year << 9 | month << 5 | day"""
+    return day.year << 9 | day.month << 5 | day.day
+
+
+def unpack(key: int) -> tuple:
+    return key >> 9, key >> 5 & 15, key & 31
+
+
+class BirthdayArray:
+    """Packed birthdays of records for reports over the whole book.
+
+    Birthdays are kept in array and names in a parallel list, removed item
+    is replaced by the last one, so the array has no holes.
+    """
+
+    def __init__(self):
+        self.keys = array("I")
+        self.names = []
+        self.positions = {}
+
+    def add(self, record) -> None:
+        self.add_birthday(record.name.value, record.birthday.value if record.birthday else None)
+
+    def add_birthday(self, name: str, birthday: date = None) -> None:
+        if birthday is None:
+            self.remove(name)
+            return
+        position = self.positions.get(name)
+        if position is None:
+            self.positions[name] = len(self.keys)
+            self.keys.append(pack(birthday))
+            self.names.append(name)
+        else:
+            self.keys[position] = pack(birthday)
+
+    def remove(self, name: str) -> None:
+        position = self.positions.pop(name, None)
+        if position is None:
+            return
+        last_key, last_name = self.keys.pop(), self.names.pop()
+        if position < len(self.keys):
+            self.keys[position], self.names[position] = last_key, last_name
+            self.positions[last_name] = position
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def counts(self) -> dict:
+        """Number of people born on every date, {packed date: count}"""
+        if np is not None and self.keys:
+            keys, counts = np.unique(np.frombuffer(self.keys, dtype=np.uint32), return_counts=True)
+            return dict(zip(keys.tolist(), counts.tolist()))
+        return Counter(self.keys)
+
+    def born_on(self, keys) -> list:
+        """Names of people born on any of packed dates"""
+        keys = set(keys)
+        if not keys:
+            return []
+        if np is not None:
+            found = np.isin(np.frombuffer(self.keys, dtype=np.uint32), np.fromiter(keys, dtype=np.uint32))
+            return [self.names[i] for i in np.flatnonzero(found).tolist()]
+        return [name for key, name in zip(self.keys, self.names) if key in keys]
+
+
+def celebration(year: int, month: int, day: int) -> date:
+    """Date birthday is celebrated in year, Feb 29 is celebrated on Feb 28 in non-leap years"""
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return date(year, month, day - 1)
+
+
+def birthday_report(birthdays: BirthdayArray, today: date) -> dict:
+    """Aggregate report of book birthdays.
+
+    Birthdays are grouped by date first, so the work after grouping depends
+    on the number of distinct dates, not on the number of contacts.
+    by_month and by_weekday count celebrations in next 365 days, ages are
+    bucketed by AGE_BUCKET years, round lists contacts turning a round age
+    in the current quarter.
+    """
+    quarter_start = 3 * ((today.month - 1) // 3) + 1
+    by_month = dict.fromkeys(range(1, 13), 0)
+    by_weekday = dict.fromkeys(range(7), 0)
+    ages = Counter()
+    round_dates = {}
+    for key, count in birthdays.counts().items():
+        year, month, day = unpack(key)
+        celebrated = celebration(today.year, month, day)
+        if celebrated < today:
+            celebrated = celebration(today.year + 1, month, day)
+        by_month[month] += count
+        by_weekday[celebrated.weekday()] += count
+        age = today.year - year - ((month, day) > (today.month, today.day))
+        if age >= 0:
+            ages[age // AGE_BUCKET * AGE_BUCKET] += count
+        turns = today.year - year
+        if quarter_start <= month < quarter_start + 3 and turns > 0 and turns % ROUND_AGE == 0:
+            round_dates[key] = (celebration(today.year, month, day), turns)
+
+    round_birthdays = sorted(
+        (*round_dates[birthdays.keys[birthdays.positions[name]]], name)
+        for name in birthdays.born_on(round_dates)
+    )
+    return {
+        "total": len(birthdays),
+        "by_month": by_month,
+        "by_weekday": by_weekday,
+        "ages": {f"{age}-{age + AGE_BUCKET - 1}": ages[age] for age in sorted(ages)},
+        "round": [{"name": name, "date": day, "age": age} for day, age, name in round_birthdays],
+    }
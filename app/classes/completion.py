@@ -0,0 +1,56 @@
+"""Module providing prefix completion for command line input."""
+
+from bisect import bisect_left, insort
+from itertools import islice
+
+# Tab shows at most this many candidates
+COMPLETION_LIMIT = 100
+
+
+class PrefixSet:
+    """Sorted set of words answering prefix queries with binary search.
+
+    Works as a flattened prefix trie: words sharing a prefix are neighbours,
+    so completion is one bisect plus a walk over the matches only.
+    """
+
+    def __init__(self, words=()):
+        self._words = sorted(set(words))
+
+    def __len__(self):
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        position = bisect_left(self._words, word)
+        return position < len(self._words) and self._words[position] == word
+
+    def insert(self, word: str) -> None:
+        if word not in self:
+            insort(self._words, word)
+
+    def discard(self, word: str) -> None:
+        position = bisect_left(self._words, word)
+        if position < len(self._words) and self._words[position] == word:
+            del self._words[position]
+
+    def complete(self, prefix: str, limit: int = COMPLETION_LIMIT) -> list:
+        """Words starting with prefix in sorted order"""
+        matches = []
+        for word in islice(self._words, bisect_left(self._words, prefix), None):
+            if not word.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(word)
+        return matches
+
+
+class Completer:
+    """readline completer asking current source for candidates once per Tab press"""
+
+    def __init__(self, source):
+        self.source = source
+        self._matches = []
+
+    def __call__(self, text: str, state: int):
+        if state == 0:
+            self._matches = self.source(text)
+        return self._matches[state] if state < len(self._matches) else None
@@ -0,0 +1,198 @@
+"""Module providing bulk import of contacts from CSV and vCard files.
+
+CSV file has a header with name, phones, email, birthday and addresses columns.
+Several phones are separated with ';', addresses are 'label: address' pairs
+separated with ';'. Birthday uses DD.MM.YYYY format like the add command.
+"""
+
+import csv
+import os
+import re
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from app.classes.address_book import describe_duplicates
+from app.classes.record import Record
+
+BATCH_SIZE = 2000
+MAX_PENDING_BATCHES = 16
+# Smaller files, or any file on single CPU, are validated in this process,
+# sending records between processes is slower than validating them
+PARALLEL_MIN_SIZE = 1_000_000
+PHONE_SEPARATORS = re.compile(r"[\s\-()]")
+# Escaped character or unescaped ';' of vCard text value
+VCARD_ESCAPE = re.compile(r"\\(.)|;")
+VCARD_ESCAPES = {"n": "\n", "N": "\n"}
+
+
+def read_csv(file_path: str):
+    """Yield (line number, row data) from contacts CSV file"""
+    with open(file_path, "r", encoding="utf-8-sig", newline="") as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            addresses = {}
+            for item in (row.get("addresses") or "").split(";"):
+                label, _, address = item.partition(":")
+                if address.strip():
+                    addresses[label.strip()] = address.strip()
+            yield reader.line_num, {
+                "name": (row.get("name") or "").strip(),
+                "phones": [p.strip() for p in (row.get("phones") or "").split(";") if p.strip()],
+                "email": (row.get("email") or "").strip() or None,
+                "birthday": (row.get("birthday") or "").strip() or None,
+                "addresses": addresses,
+            }
+
+
+def _vcard_birthday(value: str) -> str:
+    """Convert vCard BDAY (YYYY-MM-DD or YYYYMMDD) to DD.MM.YYYY"""
+    for date_format in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, date_format).strftime("%d.%m.%Y")
+        except ValueError:
+            continue
+    return value
+
+
+def _vcard_text(value: str, separator: str = ";") -> str:
+    """Unescape vCard text value, unescaped ';' is replaced by separator"""
+    return VCARD_ESCAPE.sub(lambda m: separator if m[1] is None else VCARD_ESCAPES.get(m[1], m[1]), value)
+
+
+def _vcard_lines(file):
+    """Yield (line number, unfolded line) from vCard file"""
+    number, current = 0, None
+    for line_number, line in enumerate(file, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        number, current = line_number, line
+    if current is not None:
+        yield number, current
+
+
+def read_vcard(file_path: str):
+    """Yield (line number of BEGIN:VCARD, row data) from vCard file"""
+    with open(file_path, "r", encoding="utf-8-sig") as file:
+        row, start = None, 0
+        for line_number, line in _vcard_lines(file):
+            key, _, value = line.partition(":")
+            name, *params = key.upper().split(";")
+            if name == "BEGIN":
+                row = {"name": "", "phones": [], "email": None, "birthday": None, "addresses": {}}
+                start = line_number
+            elif row is None:
+                continue
+            elif name == "END":
+                yield start, row
+                row = None
+            elif name == "FN":
+                row["name"] = _vcard_text(value).strip()
+            elif name == "TEL":
+                row["phones"].append(PHONE_SEPARATORS.sub("", _vcard_text(value)))
+            elif name == "EMAIL" and not row["email"]:
+                row["email"] = _vcard_text(value).strip()
+            elif name == "BDAY":
+                row["birthday"] = _vcard_birthday(_vcard_text(value).strip())
+            elif name == "ADR":
+                types = [p.split("=", 1)[1] for p in params if p.startswith("TYPE=")]
+                label = types[0].lower() if types else "address"
+                parts = _vcard_text(value, "\0").split("\0")
+                row["addresses"][label] = ", ".join(part for part in parts if part.strip())
+
+
+def read_contacts(file_path: str):
+    """Yield (line number, row data) from CSV or vCard file"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".csv":
+        return read_csv(file_path)
+    if extension in (".vcf", ".vcard"):
+        return read_vcard(file_path)
+    raise ValueError(f"Unsupported contacts file format '{extension}', use .csv or .vcf")
+
+
+def validate_rows(rows: list) -> list:
+    """Build records from rows, return (line number, record or None, error or None) list"""
+    results = []
+    for line_number, row in rows:
+        try:
+            if len(row["name"]) <= 3:
+                raise ValueError("Name must be more than 3 chars")
+            results.append((line_number, Record.from_dict(row), None))
+        except (ValueError, KeyError) as e:
+            results.append((line_number, None, str(e)))
+    return results
+
+
+def _batches(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _validate_parallel(batches):
+    """Validate batches in process pool keeping only few of them in flight"""
+    # Imported here, startup does not need multiprocessing for a command used rarely
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor() as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(validate_rows, batch))
+            if len(pending) >= MAX_PENDING_BATCHES:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_contacts(book, file_path: str, progress=None) -> tuple:
+    """Validate contacts from file and add them to book in batches.
+
+    Returns (number of imported records, list of (line number, error),
+    list of (line number, warning)). Phones and emails other contacts have
+    are handled by book duplicates policy, rejected records are errors,
+    records imported or merged despite duplicates are reported as warnings.
+    progress is called with numbers of imported and bad rows after every batch.
+    """
+    batches = _batches(read_contacts(file_path), BATCH_SIZE)
+    if os.path.getsize(file_path) >= PARALLEL_MIN_SIZE and (os.cpu_count() or 1) > 1:
+        results = _validate_parallel(batches)
+    else:
+        results = map(validate_rows, batches)
+
+    errors = []
+    warnings = []
+    imported = 0
+    for batch in results:
+        records = []
+        lines = {}
+        batch_errors = []
+        batch_warnings = []
+        for line_number, record, error in batch:
+            if error is None:
+                name = record.name.value
+                if name in lines or name in book.data:
+                    error = f"Contact '{name}' already exists"
+                else:
+                    lines[name] = line_number
+                    records.append(record)
+            if error is not None:
+                batch_errors.append((line_number, error))
+        for record, duplicates, target in book.add_records_unique(records):
+            message = describe_duplicates(duplicates)
+            if book.duplicates == "reject":
+                imported -= 1
+                batch_errors.append((lines[record.name.value], message))
+                continue
+            if target is not None:
+                message += f", merged into '{target}'"
+            batch_warnings.append((lines[record.name.value], message))
+        errors.extend(sorted(batch_errors))
+        warnings.extend(sorted(batch_warnings))
+        imported += len(records)
+        if progress:
+            progress(imported, len(errors))
+    return imported, errors, warnings
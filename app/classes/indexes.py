@@ -0,0 +1,504 @@
+"""Module providing in-memory search indexes for address book module."""
+
+import calendar
+import gc
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import count, islice
+from app.classes.completion import PrefixSet
+
+
+@contextmanager
+def gc_paused():
+    """Bulk index build makes millions of objects without cycles, collector would rescan them again and again"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def record_search_texts(record) -> list:
+    """Lowercased texts of record fields searched by find_by_query"""
+    texts = [record.name.value.lower()]
+    if record.email:
+        texts.append(record.email.value.lower())
+    texts.extend(record.phone_numbers)
+    texts.extend(address.address.lower() for address in record.addresses.values())
+    if record.birthday:
+        texts.append(str(record.birthday).lower())
+    return texts
+
+
+class TrigramIndex:
+    """Inverted index of record field trigrams to record ids.
+
+    Every record gets an id in insertion order, posting of a trigram is a
+    sorted array of ids. Substring query is resolved to candidates by
+    intersecting postings of its trigrams, candidates are verified against
+    record texts.
+    """
+
+    N = 3
+
+    def __init__(self):
+        self.postings = {}  # trigram -> sorted array of ids
+        self.texts = {}  # id -> lowercased texts
+        self.ids = {}  # name -> id, kept while record is changed
+        self.names = {}  # id -> name
+        self._counter = count()
+
+    @classmethod
+    def grams(cls, text: str) -> set:
+        return {text[i:i + cls.N] for i in range(len(text) - cls.N + 1)}
+
+    @classmethod
+    def record_grams(cls, texts: list) -> set:
+        n = cls.N
+        return {text[i:i + n] for text in texts for i in range(len(text) - n + 1)}
+
+    def build(self, records) -> None:
+        """Index records in one pass, ids grow so postings are appended already sorted"""
+        postings = defaultdict(list)
+        for record in records:
+            name = record.name.value
+            if name in self.ids:
+                self.add(record)
+                continue
+            record_id = self.ids[name] = next(self._counter)
+            self.names[record_id] = name
+            texts = self.texts[record_id] = record_search_texts(record)
+            for gram in self.record_grams(texts):
+                postings[gram].append(record_id)
+        for gram, ids in postings.items():
+            self.postings.setdefault(gram, array("I")).extend(ids)
+
+    def add(self, record) -> None:
+        name = record.name.value
+        record_id = self.ids.get(name)
+        if record_id is None:
+            record_id = self.ids[name] = next(self._counter)
+            self.names[record_id] = name
+        else:
+            self._discard(record_id)
+        texts = self.texts[record_id] = record_search_texts(record)
+        for gram in self.record_grams(texts):
+            insort(self.postings.setdefault(gram, array("I")), record_id)
+
+    def remove(self, name: str) -> None:
+        record_id = self.ids.pop(name, None)
+        if record_id is not None:
+            self._discard(record_id)
+            del self.names[record_id]
+
+    def _discard(self, record_id: int) -> None:
+        for gram in self.record_grams(self.texts.pop(record_id)):
+            ids = self.postings[gram]
+            del ids[bisect_left(ids, record_id)]
+            if not ids:
+                del self.postings[gram]
+
+    @staticmethod
+    def _intersect(candidates, ids):
+        """Ids of sorted candidates which sorted ids also have"""
+        if len(candidates) * 16 < len(ids):
+            # Few candidates are looked up, large posting is not scanned
+            found = []
+            for record_id in candidates:
+                position = bisect_left(ids, record_id)
+                if position < len(ids) and ids[position] == record_id:
+                    found.append(record_id)
+            return found
+        return sorted(set(candidates).intersection(ids))
+
+    def search(self, query: str) -> list:
+        """Return names of records with query as substring of any field, in insertion order"""
+        query = query.lower()
+        if len(query) < self.N:
+            # Too short to have a trigram, verify every record
+            candidates = sorted(self.texts)
+        else:
+            postings = sorted((self.postings.get(gram, ()) for gram in self.grams(query)), key=len)
+            candidates = postings[0]
+            for ids in postings[1:]:
+                if not candidates:
+                    break
+                candidates = self._intersect(candidates, ids)
+        return [
+            self.names[record_id] for record_id in candidates
+            if any(query in text for text in self.texts[record_id])
+        ]
+
+
+class PhoneIndex:
+    """Phone to record names index with sorted digit arrays for prefix and suffix search"""
+
+    def __init__(self):
+        self.owners = defaultdict(set)
+        self.phones = {}
+        self._prefixes = []  # sorted (phone, name)
+        self._suffixes = []  # sorted (reversed phone, name)
+
+    def build(self, records) -> None:
+        """Index records of empty index, phone pairs are collected and sorted once"""
+        for record in records:
+            name = record.name.value
+            phones = self.phones[name] = record.phone_numbers
+            for phone in phones:
+                self.owners[phone].add(name)
+                self._prefixes.append((phone, name))
+                self._suffixes.append((phone[::-1], name))
+        self._prefixes.sort()
+        self._suffixes.sort()
+
+    def add(self, record) -> None:
+        name = record.name.value
+        self.remove(name)
+        phones = record.phone_numbers
+        self.phones[name] = phones
+        for phone in phones:
+            self.owners[phone].add(name)
+            insort(self._prefixes, (phone, name))
+            insort(self._suffixes, (phone[::-1], name))
+
+    def remove(self, name: str) -> None:
+        for phone in self.phones.pop(name, ()):
+            owners = self.owners[phone]
+            owners.discard(name)
+            if not owners:
+                del self.owners[phone]
+            self._delete(self._prefixes, (phone, name))
+            self._delete(self._suffixes, (phone[::-1], name))
+
+    @staticmethod
+    def _delete(items: list, item: tuple) -> None:
+        position = bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    @staticmethod
+    def _scan(items: list, prefix: str) -> list:
+        names = {}
+        for key, name in islice(items, bisect_left(items, (prefix,)), None):
+            if not key.startswith(prefix):
+                break
+            names[name] = None
+        return list(names)
+
+    def find(self, phone: str) -> set:
+        """Names of records which have exactly this phone"""
+        return self.owners.get(phone, set())
+
+    def starts_with(self, prefix: str) -> list:
+        """Names of records with phone starting with prefix, ordered by phone"""
+        return self._scan(self._prefixes, prefix)
+
+    def ends_with(self, suffix: str) -> list:
+        """Names of records with phone ending with suffix, ordered by reversed phone"""
+        return self._scan(self._suffixes, suffix[::-1])
+
+
+class NameIndex(PrefixSet):
+    """Record names for prefix completion"""
+
+    def build(self, records) -> None:
+        self._words = sorted({record.name.value for record in records})
+
+    def add(self, record) -> None:
+        self.insert(record.name.value)
+
+    def remove(self, name: str) -> None:
+        self.discard(name)
+
+
+def name_sort_key(record) -> str:
+    return record.name.value
+
+
+def birthday_sort_key(record) -> int:
+    """Birthday as month * 100 + day, records without birthday go last"""
+    if not record.birthday:
+        return 9999
+    return record.birthday.value.month * 100 + record.birthday.value.day
+
+
+class SortedIndex:
+    """Records names sorted by (key, name) for cursor based pagination"""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = []
+        self.keys = {}
+
+    def build(self, records) -> None:
+        """Index records of empty index sorting them once"""
+        self.keys = {record.name.value: (self.key(record), record.name.value) for record in records}
+        self.items = sorted(self.keys.values())
+
+    def add(self, record) -> None:
+        name = record.name.value
+        self.remove(name)
+        item = (self.key(record), name)
+        self.keys[name] = item
+        insort(self.items, item)
+
+    def remove(self, name: str) -> None:
+        item = self.keys.pop(name, None)
+        if item is not None:
+            del self.items[bisect_left(self.items, item)]
+
+    def page(self, cursor: tuple = None, size: int = 20) -> tuple:
+        """Return names after cursor and cursor of next page, None if it is the last page"""
+        start = bisect_right(self.items, cursor) if cursor else 0
+        items = self.items[start:start + size]
+        next_cursor = items[-1] if start + size < len(self.items) else None
+        return [name for _, name in items], next_cursor
+
+
+def normalize_unique(value: str) -> str:
+    """Form of phone or email compared for uniqueness"""
+    return value.strip().lower()
+
+
+def record_phones(record) -> tuple:
+    return record.phone_numbers
+
+
+def record_emails(record) -> tuple:
+    return (record.email.value,) if record.email else ()
+
+
+class UniqueIndex:
+    """Hash index of normalized field values to names of records which have them.
+
+    Owner is kept as plain name, set is made only when value is shared,
+    so the index of unique values stays small.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.owners = {}  # value -> name, or set of names when shared
+        self.keys = {}  # name -> its values
+        self.shared_keys = set()
+
+    def add(self, record) -> None:
+        self.add_values(record.name.value, self.values(record))
+
+    def add_values(self, name: str, values) -> None:
+        self.remove(name)
+        keys = tuple(dict.fromkeys(normalize_unique(value) for value in values))
+        if not keys:
+            return
+        self.keys[name] = keys
+        for key in keys:
+            names = self.owners.get(key)
+            if names is None:
+                self.owners[key] = name
+            elif isinstance(names, set):
+                names.add(name)
+            else:
+                self.owners[key] = {names, name}
+                self.shared_keys.add(key)
+
+    def remove(self, name: str) -> None:
+        for key in self.keys.pop(name, ()):
+            names = self.owners[key]
+            if isinstance(names, set):
+                names.discard(name)
+                if len(names) == 1:
+                    self.owners[key] = names.pop()
+                    self.shared_keys.discard(key)
+            else:
+                del self.owners[key]
+
+    def find(self, value: str) -> set:
+        """Names of records which have value"""
+        names = self.owners.get(normalize_unique(value), ())
+        return {names} if isinstance(names, str) else set(names)
+
+    def shared(self):
+        """Yield (value, names) of values which several records have"""
+        for key in self.shared_keys:
+            yield key, self.owners[key]
+
+
+def calendar_window(start: date, period: int) -> dict:
+    """Map (month, day) of birthdays to the date they are celebrated in next period days.
+
+    Feb 29 birthdays are celebrated on Feb 28 in non-leap years.
+    """
+    days = {}
+    for offset in range(min(period, 366)):
+        day = start + timedelta(days=offset)
+        days.setdefault((day.month, day.day), day)
+        if (day.month, day.day) == (2, 28) and not calendar.isleap(day.year):
+            days.setdefault((2, 29), day)
+    return days
+
+
+class BirthdayIndex:
+    """Calendar index of birthday (month, day) to record names"""
+
+    def __init__(self):
+        self.days = defaultdict(dict)
+        self.birthdays = {}
+
+    def add(self, record) -> None:
+        name = record.name.value
+        self.remove(name)
+        if record.birthday:
+            key = (record.birthday.value.month, record.birthday.value.day)
+            self.birthdays[name] = key
+            self.days[key][name] = None
+
+    def remove(self, name: str) -> None:
+        key = self.birthdays.pop(name, None)
+        if key is not None:
+            del self.days[key][name]
+            if not self.days[key]:
+                del self.days[key]
+
+    def in_period(self, start: date, period: int):
+        """Yield (name, date) for birthdays celebrated in next period days"""
+        for key, day in calendar_window(start, period).items():
+            for name in self.days.get(key, ()):
+                yield name, day
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance with adjacent transpositions, limit + 1 if it is over limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if cost and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return min(current[-1], limit + 1)
+
+
+def allowed_distance(word: str) -> int:
+    """Typos allowed in word of this length, short words must match exactly"""
+    if word.isdigit() or len(word) < 3:
+        return 0
+    return 1 if len(word) < 6 else 2
+
+
+class FuzzyNameIndex:
+    """Symmetric delete index of name words for typo tolerant name search.
+
+    Every word is stored under all strings made by deleting up to its
+    allowed_distance chars, query words look up their own deletes, so
+    lookup cost depends on word length, not on the number of names.
+    Candidates are verified by edit_distance. Words which must match
+    exactly, like numbers, are only in postings.
+    """
+
+    def __init__(self):
+        self.deletes = defaultdict(set)  # delete string -> words
+        self.postings = {}  # word -> name, or set of names when shared
+        self.words = {}  # name -> its words
+
+    @staticmethod
+    def split(name: str) -> tuple:
+        return tuple(dict.fromkeys(name.lower().split()))
+
+    @staticmethod
+    def variants(word: str, distance: int) -> set:
+        """word and all strings made of it by deleting up to distance chars"""
+        found = {word}
+        level = {word}
+        for _ in range(distance):
+            level = {item[:i] + item[i + 1:] for item in level for i in range(len(item))}
+            found |= level
+        return found
+
+    def add(self, record) -> None:
+        self.add_name(record.name.value)
+
+    def add_name(self, name: str) -> None:
+        if name in self.words:
+            return
+        words = self.words[name] = self.split(name)
+        for word in words:
+            names = self.postings.get(word)
+            if names is None:
+                self.postings[word] = name
+                for variant in self.variants(word, allowed_distance(word)) if allowed_distance(word) else ():
+                    self.deletes[variant].add(word)
+            elif isinstance(names, set):
+                names.add(name)
+            else:
+                self.postings[word] = {names, name}
+
+    def remove(self, name: str) -> None:
+        for word in self.words.pop(name, ()):
+            names = self.postings[word]
+            if isinstance(names, set):
+                names.discard(name)
+                if len(names) == 1:
+                    self.postings[word] = names.pop()
+                continue
+            del self.postings[word]
+            for variant in self.variants(word, allowed_distance(word)) if allowed_distance(word) else ():
+                words = self.deletes[variant]
+                words.discard(word)
+                if not words:
+                    del self.deletes[variant]
+
+    def _names(self, word: str):
+        names = self.postings.get(word, ())
+        return (names,) if isinstance(names, str) else names
+
+    def similar_words(self, word: str, max_distance: int) -> dict:
+        """Return {indexed word: distance} for words within allowed distance of word"""
+        limit = min(max_distance, allowed_distance(word))
+        found = {word: 0} if word in self.postings else {}
+        for variant in self.variants(word, limit) if limit else ():
+            for candidate in self.deletes.get(variant, ()):
+                if candidate not in found:
+                    found[candidate] = edit_distance(word, candidate, min(limit, allowed_distance(candidate)))
+        return {candidate: distance for candidate, distance in found.items()
+                if distance <= min(limit, allowed_distance(candidate))}
+
+    def search(self, query: str, max_distance: int = 2, limit: int = 10) -> list:
+        """Return up to limit (name, distance) closest to query, distance is sum over query words.
+
+        Names matching every query word go first, a missing word counts as max_distance + 1.
+        """
+        query_words = self.split(query)
+        if not query_words:
+            return []
+        matches = [self.similar_words(word, max_distance) for word in query_words]
+        # Query words matching nothing, like unknown numbers, do not empty intersection
+        candidates = [set().union(*(self._names(word) for word in words)) for words in matches if words]
+        if not candidates:
+            return []
+        full = set.intersection(*candidates)
+        if len(full) < limit and len(candidates) > 2:
+            # Names missing one of query words, before names matching any of them
+            for i in range(len(candidates)):
+                full |= set.intersection(*candidates[:i], *candidates[i + 1:])
+        if len(full) < limit:
+            full = set().union(*candidates)
+
+        def score(name: str) -> tuple:
+            words = self.words[name]
+            distance = sum(
+                min((found[word] for word in words if word in found), default=max_distance + 1)
+                for found in matches
+            )
+            return distance, abs(len(name) - len(query)), name
+
+        return [(name, distance) for distance, _, name in heapq.nsmallest(limit, map(score, full))]
@@ -0,0 +1,298 @@
+"""Module providing append-only change journal for address book module."""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from app.classes.metrics import metrics
+from app.classes.record import Record
+from app.classes.safe_files import file_lock, temp_file
+from app.classes.snapshot import SnapshotRecords, read_snapshot, write_snapshot
+
+
+class Journal:
+    """Append-only journal of address book changes shared by processes.
+
+    Every change is written as one fsync'd json line next to the book snapshot,
+    the first line is a header with journal generation. Processes append under
+    a file lock after applying entries written by others since their last read,
+    so (generation, offset) is the version of the book and no update is lost.
+
+    When journal grows over `compact_every` entries it is rotated to
+    `<journal>.<generation>` and merged into the snapshot by a background thread.
+    Merged journal is kept as `<journal>.<generation>.merged` until the next
+    merge, so processes which have not read it yet can catch up without reload.
+    Merged snapshot is put in place by the thread changing the book on its next
+    journal write, refresh or close, book stops mapping the old file first
+    (mapped file can not be replaced on Windows) and maps the new one after.
+    """
+
+    def __init__(self, snapshot_path: str, compact_every: int = 1000):
+        self.snapshot_path = snapshot_path
+        self.path = f"{snapshot_path}.journal"
+        self.lock_path = f"{snapshot_path}.lock"
+        self.compact_every = compact_every
+        self.book = None
+        self.generation = 0
+        self._offset = 0  # bytes of current journal applied to book
+        self._entries = 0
+        self._stamp = None  # journal file state after last read, to skip needless reads
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._merged = None  # (temp file, generation) of merged snapshot waiting to be put in place
+
+    def archive_path(self, generation: int) -> str:
+        return f"{self.path}.{generation}"
+
+    def load(self):
+        """Load snapshot, replay journal after it and start logging changes of the book"""
+        with self._lock, file_lock(self.lock_path):
+            book = self._merge_legacy(self._read_snapshot())
+            if not os.path.exists(self.path):
+                self._start_journal(book.generation + 1)
+            self.book = book
+            self.generation, self._offset = book.generation + 1, 0
+            self._catch_up()
+        book.journal = self
+        # Previous merge was interrupted, finish it
+        if os.path.exists(self.archive_path(self.generation - 1)):
+            self._start_compaction(self.generation - 1)
+        return book
+
+    def _read_snapshot(self):
+        from app.classes.address_book import AddressBook
+
+        if not os.path.exists(self.snapshot_path):
+            return AddressBook()
+        return read_snapshot(self.snapshot_path)
+
+    def _start_journal(self, generation: int) -> None:
+        with temp_file(self.path) as f:
+            f.write(json.dumps({"op": "header", "generation": generation}) + "\n")
+        os.replace(f.name, self.path)
+
+    def _merge_legacy(self, book):
+        """Merge journal written before journals had headers into snapshot, return book read from it"""
+        legacy = [path for path in (f"{self.path}.compacting", self.path) if self._generation_of(path) is None]
+        if not legacy:
+            return book
+        for path in legacy:
+            for _, entry in self._read_entries(path):
+                self.apply(book, entry)
+        with temp_file(self.snapshot_path, "wb") as f:
+            write_snapshot(f, book)
+        book.close()
+        os.replace(f.name, self.snapshot_path)
+        for path in legacy:
+            os.remove(path)
+        return self._read_snapshot()
+
+    @staticmethod
+    def _generation_of(path: str):
+        """Generation from journal header, 0 for missing file and None for journal without header"""
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+        return header.get("generation") if header.get("op") == "header" else None
+
+    @staticmethod
+    def apply(book, entry: dict) -> bool:
+        """Apply one journal entry to book, return False for header or broken line"""
+        op = entry.get("op") if entry else None
+        if op == "put":
+            book.add_record(Record.from_dict(entry["record"]))
+        elif op == "delete":
+            if entry["name"] in book.data:
+                book.delete(entry["name"])
+        else:
+            return False
+        return True
+
+    @staticmethod
+    def _read_entries(path: str, offset: int = 0):
+        """Yield (offset after line, entry or None if broken) of complete lines, torn last line is left"""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    yield offset, json.loads(line)
+                except ValueError:
+                    yield offset, None
+
+    @contextmanager
+    def _unlogged(self):
+        """Change book without writing the changes to journal"""
+        self.book.journal = None
+        try:
+            yield
+        finally:
+            self.book.journal = self
+
+    def _catch_up(self) -> None:
+        """Apply entries written by other processes, caller holds file lock"""
+        live = self._generation_of(self.path)
+        with self._unlogged():
+            while self.generation < live:
+                archive = self._find_archive(self.generation)
+                if archive is None:
+                    # Behind more than one merge, start from newest snapshot
+                    self._reload()
+                    return
+                for _, entry in self._read_entries(archive, self._offset):
+                    self.apply(self.book, entry)
+                self.generation, self._offset, self._entries = self.generation + 1, 0, 0
+            for self._offset, entry in self._read_entries(self.path, self._offset):
+                self._entries += self.apply(self.book, entry)
+        self._stamp = self._file_stamp()
+
+    def _find_archive(self, generation: int):
+        for path in (self.archive_path(generation), f"{self.archive_path(generation)}.merged"):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _reload(self) -> None:
+        old, snapshot = self.book.data, self._read_snapshot()
+        self.book.__setstate__(snapshot.__getstate__())
+        if isinstance(old, SnapshotRecords):
+            old.close()
+        self.generation, self._offset, self._entries = snapshot.generation + 1, 0, 0
+        self._catch_up()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def changed(self) -> bool:
+        """True if journal file was written since last read"""
+        return self._file_stamp() != self._stamp
+
+    def refresh(self) -> None:
+        """Apply changes written by other processes since last read"""
+        merged = self._merged is not None
+        if not merged and not self.changed():
+            return
+        with self._lock, file_lock(self.lock_path, shared=not merged):
+            if merged:
+                self._install_merged()
+            self._catch_up()
+
+    def log_put(self, record: Record) -> None:
+        """Log new state of record"""
+        self.log_puts([record])
+
+    def log_puts(self, records: list) -> None:
+        """Log new state of many records with one fsync"""
+        def restore():
+            # Entries of other processes were written earlier, ours win
+            for record in records:
+                if self.book.data.get(record.name.value) is not record:
+                    self.book.add_record(record)
+
+        self._append([{"op": "put", "record": record.to_dict()} for record in records], restore)
+
+    def log_delete(self, name: str) -> None:
+        """Log record removal"""
+        def restore():
+            if name in self.book.data:
+                self.book.delete(name)
+
+        self._append([{"op": "delete", "name": name}], restore)
+
+    @metrics.timed("journal")
+    def _append(self, entries: list, restore) -> None:
+        with self._lock, file_lock(self.lock_path):
+            self._install_merged()
+            self._catch_up()
+            with self._unlogged():
+                restore()
+            with open(self.path, "ab") as f:
+                if f.tell() > self._offset:
+                    # Torn line of crashed process
+                    f.truncate(self._offset)
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode())
+                f.flush()
+                os.fsync(f.fileno())
+                self._offset = f.tell()
+            self._entries += len(entries)
+            self._stamp = self._file_stamp()
+            if self._entries < self.compact_every or os.path.exists(self.archive_path(self.generation - 1)):
+                return
+            # Rotate journal, compaction merges rotated part into snapshot
+            rotated = self.generation
+            os.replace(self.path, self.archive_path(rotated))
+            self._start_journal(rotated + 1)
+            self.generation, self._offset, self._entries = rotated + 1, 0, 0
+            self._stamp = None
+        self._start_compaction(rotated)
+
+    def _start_compaction(self, generation: int) -> None:
+        if self._compactor and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, args=(generation,), daemon=True)
+        self._compactor.start()
+
+    def compact(self, generation: int) -> None:
+        """Merge rotated journal of generation into snapshot file"""
+        archive = self.archive_path(generation)
+        with file_lock(self.lock_path, shared=True):
+            if not os.path.exists(archive):
+                return
+            book = self._read_snapshot()
+        try:
+            for _, entry in self._read_entries(archive):
+                self.apply(book, entry)
+            book.generation = generation
+            with temp_file(self.snapshot_path, "wb") as f:
+                write_snapshot(f, book)
+        finally:
+            book.close()
+        with self._lock:
+            self._merged = f.name, generation
+
+    def _install_merged(self) -> None:
+        """Put merged snapshot in place of the one book maps, caller holds exclusive file lock"""
+        if self._merged is None:
+            return
+        (path, generation), self._merged = self._merged, None
+        archive = self.archive_path(generation)
+        if not os.path.exists(archive):
+            # Other process has merged it already
+            os.remove(path)
+            return
+        data = self.book.data
+        if isinstance(data, SnapshotRecords):
+            data.close()
+        try:
+            os.replace(path, self.snapshot_path)
+        except OSError:
+            # Other process still maps the snapshot, archive is merged again on next load
+            os.remove(path)
+        else:
+            os.replace(archive, f"{archive}.merged")
+            previous = f"{self.archive_path(generation - 1)}.merged"
+            if os.path.exists(previous):
+                os.remove(previous)
+        finally:
+            if isinstance(data, SnapshotRecords):
+                mapped = read_snapshot(self.snapshot_path).data
+                mapped.take_changes(data)
+                mapped.book, self.book.data = self.book, mapped
+
+    def close(self) -> None:
+        """Wait for running compaction and put its snapshot in place"""
+        if self._compactor:
+            self._compactor.join()
+        if self._merged is not None:
+            with self._lock, file_lock(self.lock_path):
+                self._install_merged()
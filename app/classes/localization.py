@@ -1,19 +1,37 @@
-import yaml
+import atexit
+import json
 import os
+import pickle
+from app.classes.metrics import metrics
+
+# Мова за замовчуванням без інтерактивного вибору, наприклад PIPBOY_LANG=en
+LANGUAGE_ENV = "PIPBOY_LANG"
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "locals")
+
 
 class Localization:
-    def __init__(self, locale_dir="./app/locals"):
+    def __init__(self, locale_dir=LOCALE_DIR, language=None):
         self.translations = {}
+        self.missing = []
         self.locale_dir = locale_dir
-        self.language = self.choose_language()
+        self.language = language or self.choose_language()
         self.file_path = os.path.join(self.locale_dir, f"{self.language}.yaml")
+        self.cache_path = os.path.join(self.locale_dir, "__pycache__", f"{self.language}.pickle")
+        # Відсутні ключі пишуться в окремий файл поза git, а не у файл перекладів
+        self.missing_path = os.path.join(self.locale_dir, "missing", f"{self.language}.yaml")
         self.load_language(self.language)
 
+    def available_languages(self) -> list:
+        """Повертає список мов з файлів у папці локалізацій."""
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.locale_dir) if f.endswith('.yaml'))
+
     def choose_language(self) -> str:
-        """Запитує у користувача бажану мову з доступних файлів у папці."""
-        files = [f for f in os.listdir(self.locale_dir) if f.endswith('.yaml')]
-        languages = [os.path.splitext(f)[0] for f in files]
-        
+        """Бере мову зі змінної оточення, інакше запитує у користувача."""
+        languages = self.available_languages()
+        lang = os.environ.get(LANGUAGE_ENV, "").strip().lower()
+        if lang in languages:
+            return lang
+
         print("Виберіть мову:", ", ".join(languages))
         lang = input("Language: ").strip().lower()
 
@@ -23,29 +41,93 @@ class Localization:
 
         return lang
 
+    def _file_stamp(self) -> tuple:
+        stat = os.stat(self.file_path)
+        return stat.st_mtime_ns, stat.st_size
+
     def load_language(self, lang: str):
-        """Завантажує файл локалізації для вибраної мови."""
+        """Завантажує файл локалізації, використовуючи кеш, поки YAML не змінився."""
+        stamp = self._file_stamp()
+        try:
+            with open(self.cache_path, "rb") as f:
+                cached_stamp, translations = pickle.load(f)
+            if cached_stamp == stamp:
+                self.translations = translations
+                return
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+
+        import yaml  # imported only when cache is stale, it is slow to import
+
         with open(self.file_path, "r", encoding="utf-8") as f:
             self.translations = yaml.safe_load(f) or {}
+        self._write_cache(stamp)
+
+    def _write_cache(self, stamp: tuple):
+        """Зберігає розібраний словник у кеш поруч з файлами локалізації."""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((stamp, self.translations), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
 
     def append_missing_translation(self, key: str):
-        """Додає відсутній ключ у файл локалізації та оновлює словник у пам'яті."""
+        """Додає відсутній ключ у словник, у файл він буде записаний в flush_missing."""
         self.translations[key] = key  # Оновлюємо словник перекладів у пам'яті
-        with open(self.file_path, "a", encoding="utf-8") as f:
-            f.write(f"\n{key}: {key}")
+        self.missing.append(key)
+
+    def flush_missing(self):
+        """Дописує накопичені відсутні ключі у файл відсутніх перекладів, ключі з попередніх запусків не повторюються."""
+        if not self.missing:
+            return
+        lines = [
+            f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(key, ensure_ascii=False)}\n"
+            for key in self.missing
+        ]
+        self.missing = []
+        try:
+            os.makedirs(os.path.dirname(self.missing_path), exist_ok=True)
+            with open(self.missing_path, "a+", encoding="utf-8") as f:
+                f.seek(0)
+                written = set(f)
+                f.write("".join(line for line in dict.fromkeys(lines) if line not in written))
+        except OSError:
+            pass
 
-    def translate(self, key: str) -> str:
-        """Повертає перекладений текст для заданого ключа або додає його, якщо він відсутній."""
+    def translate(self, key: str, remember: bool = True) -> str:
+        """Повертає перекладений текст для заданого ключа або запам'ятовує його, якщо він відсутній.
+
+        remember=False для тексту, що вже містить дані, наприклад повідомлень винятків.
+        """
         if key in self.translations:
             return self.translations[key]
-        # If not, add the key and value to both the file and self.translations
+        if not remember:
+            return key
+        # If not, remember the key, it is written to the file on exit
         self.append_missing_translation(key)
         return self.translations[key]
 
 
-# Створюємо єдиний екземпляр Localization, доступний глобально
-_localization = Localization()
+# Єдиний екземпляр Localization створюється при першому перекладі
+_localization = None
+
+
+def get_localization() -> Localization:
+    """Повертає глобальний екземпляр Localization, створюючи його при першому виклику."""
+    global _localization
+    if _localization is None:
+        _localization = Localization()
+        atexit.register(_localization.flush_missing)
+    return _localization
+
+
+@metrics.timed("trans")
+def trans(key: str, remember: bool = True) -> str:
+    """Глобальна функція для перекладу, що використовує єдиний екземпляр Localization.
 
-def trans(key: str) -> str:
-    """Глобальна функція для перекладу, що використовує єдиний екземпляр Localization."""
-    return _localization.translate(key)
+    Шаблони перекладаються до .format(), тож у файл відсутніх ключів не потрапляють дані.
+    """
+    return (_localization or get_localization()).translate(key, remember)
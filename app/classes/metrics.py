@@ -0,0 +1,153 @@
+"""Module providing opt-in latency metrics of commands and their phases."""
+
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# Metrics are collected when this variable is set, like PIPBOY_METRICS=1
+METRICS_ENV = "PIPBOY_METRICS"
+# Bucket bounds grow by 10%, so percentiles are accurate to 10%
+BUCKET_GROWTH = 1.1
+MIN_SECONDS = 1e-6
+# Time spent waiting for user, it is not counted as command work
+WAIT_PHASES = ("prompt", "input")
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets, memory does not grow with calls"""
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        bucket = 0 if seconds <= MIN_SECONDS else math.ceil(math.log(seconds / MIN_SECONDS, BUCKET_GROWTH))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of bucket holding percent of calls"""
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(MIN_SECONDS * BUCKET_GROWTH ** bucket, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "max": self.max, "buckets": dict(self.buckets)}
+
+
+class Metrics:
+    """Counters and latency histograms per (command, phase), nothing is recorded until enabled.
+
+    Phase is timed only inside a command, phases may nest, like trans inside render.
+    Besides its phases every command gets 'total' and 'work', which is total
+    without time of waiting for user.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # command run by current thread
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def record(self, command: str, phase: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.histograms[command, phase].add(seconds)
+        if phase in WAIT_PHASES and getattr(self._local, "command", None) == command:
+            self._local.waited += seconds
+
+    @contextmanager
+    def command(self, name: str):
+        """Time command, its phases are recorded under its name"""
+        if not self.enabled:
+            yield
+            return
+        self._local.command, self._local.waited = name, 0.0
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.count(f"{name}:errors")
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(name, "total", elapsed)
+            self.record(name, "work", elapsed - self._local.waited)
+            self._local.command = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time phase of running command"""
+        command = getattr(self._local, "command", None) if self.enabled else None
+        if command is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(command, name, time.perf_counter() - start)
+
+    def timed(self, phase: str):
+        """Decorator timing every call of function as phase"""
+        def decorator(func):
+            @wraps(func)
+            def inner(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.phase(phase):
+                    return func(*args, **kwargs)
+            return inner
+        return decorator
+
+    def summary(self) -> list:
+        """Rows with calls, p50, p95, p99 and max seconds per command and phase"""
+        with self._lock:
+            items = sorted(self.histograms.items())
+            return [
+                {
+                    "command": command, "phase": phase, "calls": histogram.count,
+                    "p50": histogram.percentile(50), "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99), "max": histogram.max,
+                    "errors": self.counters.get(f"{command}:errors", 0) if phase == "total" else 0,
+                }
+                for (command, phase), histogram in items
+            ]
+
+    def dump(self, file_path: str) -> None:
+        """Write counters, raw histograms and summary to json file"""
+        with self._lock:
+            histograms = {f"{command}/{phase}": h.to_dict() for (command, phase), h in self.histograms.items()}
+            counters = dict(self.counters)
+        data = {
+            "bucket_growth": BUCKET_GROWTH, "min_seconds": MIN_SECONDS,
+            "counters": counters, "histograms": histograms, "summary": self.summary(),
+        }
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+# One collector for the whole process
+metrics = Metrics()
@@ -0,0 +1,48 @@
+"""Module providing persistent passphrase based key for notes encryption."""
+
+import base64
+import json
+import os
+from app.classes.safe_files import atomic_write
+
+# Notes passphrase without interactive prompt, useful for scripts
+PASSPHRASE_ENV = "PIPBOY_NOTES_PASSPHRASE"
+ITERATIONS = 390_000
+CHECK_TEXT = b"pip-boy notes key"
+
+
+def load_cipher(key_file: str, passphrase: str):
+    """Return Fernet cipher derived from passphrase and salt stored in key_file.
+
+    Key file is created on first use, it keeps salt and a token to check that
+    the same passphrase is used after restart. Raises ValueError on wrong passphrase.
+    """
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+    stored = None
+    if os.path.exists(key_file):
+        with open(key_file, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        salt, iterations = base64.b64decode(stored["salt"]), stored["iterations"]
+    else:
+        salt, iterations = os.urandom(16), ITERATIONS
+
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations)
+    cipher = Fernet(base64.urlsafe_b64encode(kdf.derive(passphrase.encode())))
+
+    if stored is not None:
+        try:
+            cipher.decrypt(stored["check"].encode())
+        except InvalidToken as e:
+            raise ValueError("Wrong passphrase for notes key") from e
+        return cipher
+
+    with atomic_write(key_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "salt": base64.b64encode(salt).decode(),
+            "iterations": iterations,
+            "check": cipher.encrypt(CHECK_TEXT).decode(),
+        }, f)
+    return cipher
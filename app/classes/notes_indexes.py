@@ -0,0 +1,177 @@
+"""Module providing in-memory search indexes for notes module."""
+
+import heapq
+import math
+import re
+from collections import defaultdict
+from app.classes.completion import PrefixSet
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens of text"""
+    return TOKEN_RE.findall(text.lower())
+
+
+class NotesSearchIndex:
+    """Inverted index of note words with BM25 ranking.
+
+    Query words are joined with AND, groups separated by OR are alternatives:
+    'vault water OR radio' finds notes with both 'vault' and 'water' or with 'radio'.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    SNIPPET_WIDTH = 60
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {title: term frequency}
+        self.lengths = {}
+        self.terms = {}
+        self.total_length = 0
+
+    def add(self, title: str, note: dict) -> None:
+        self.remove(title)
+        # Content of encrypted note is a token, only its title is searchable
+        tokens = tokenize(title if note.get("encrypted") else f"{title} {note['content']}")
+        self.lengths[title] = len(tokens)
+        self.total_length += len(tokens)
+        for token in tokens:
+            frequencies = self.postings[token]
+            frequencies[title] = frequencies.get(title, 0) + 1
+        self.terms[title] = set(tokens)
+
+    def remove(self, title: str) -> None:
+        if title not in self.lengths:
+            return
+        self.total_length -= self.lengths.pop(title)
+        for term in self.terms.pop(title):
+            frequencies = self.postings[term]
+            del frequencies[title]
+            if not frequencies:
+                del self.postings[term]
+
+    @staticmethod
+    def parse_query(query: str) -> list:
+        """Split query into OR groups of AND terms"""
+        groups = [tokenize(group) for group in re.split(r"\s+OR\s+", query.strip())]
+        return [group for group in groups if group]
+
+    def _matches(self, group: list) -> set:
+        postings = sorted((self.postings.get(term, {}) for term in group), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Return up to limit (title, score) pairs, best matches first"""
+        groups = self.parse_query(query)
+        candidates = set().union(*(self._matches(group) for group in groups))
+        if not candidates:
+            return []
+        terms = {term for group in groups for term in group}
+        count = len(self.lengths)
+        average_length = self.total_length / count or 1
+        scores = defaultdict(float)
+        for term in terms:
+            frequencies = self.postings.get(term, {})
+            idf = math.log(1 + (count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for title in candidates.intersection(frequencies):
+                frequency = frequencies[title]
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[title] / average_length)
+                scores[title] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+    @classmethod
+    def snippet(cls, content: str, query: str) -> str:
+        """Part of content around the first query word"""
+        terms = {term for group in cls.parse_query(query) for term in group}
+        match = next(
+            (m for m in TOKEN_RE.finditer(content) if m.group().lower() in terms), None
+        )
+        if match is None:
+            return content[:cls.SNIPPET_WIDTH] + ("..." if len(content) > cls.SNIPPET_WIDTH else "")
+        start = max(0, match.start() - cls.SNIPPET_WIDTH // 2)
+        end = start + cls.SNIPPET_WIDTH
+        return ("..." if start else "") + content[start:end] + ("..." if end < len(content) else "")
+
+
+class TagIndex:
+    """Tag to note titles index with boolean tag queries.
+
+    Query supports AND, OR, NOT and parentheses, tags next to each other are
+    joined with AND: 'work urgent NOT done' equals 'work AND urgent AND NOT done'.
+    """
+
+    OPERATORS = {"AND", "OR", "NOT", "(", ")"}
+
+    def __init__(self):
+        self.titles = defaultdict(set)
+        self.tags = {}
+
+    def add(self, title: str, note: dict) -> None:
+        self.remove(title)
+        tags = set(note["tags"])
+        self.tags[title] = tags
+        for tag in tags:
+            self.titles[tag].add(title)
+
+    def remove(self, title: str) -> None:
+        for tag in self.tags.pop(title, ()):
+            titles = self.titles[tag]
+            titles.discard(title)
+            if not titles:
+                del self.titles[tag]
+
+    def counts(self) -> dict:
+        """Number of notes for every tag"""
+        return {tag: len(titles) for tag, titles in sorted(self.titles.items())}
+
+    def query(self, query: str) -> set:
+        """Return titles of notes matching boolean tag query"""
+        tokens = re.findall(r"\(|\)|[^\s()]+", query)
+        result, position = self._parse_or(tokens, 0)
+        if position != len(tokens):
+            raise ValueError(f"Unexpected '{tokens[position]}' in tag query")
+        return result
+
+    def _parse_or(self, tokens: list, position: int) -> tuple:
+        result, position = self._parse_and(tokens, position)
+        while position < len(tokens) and tokens[position] == "OR":
+            right, position = self._parse_and(tokens, position + 1)
+            result = result | right
+        return result, position
+
+    def _parse_and(self, tokens: list, position: int) -> tuple:
+        result, position = self._parse_not(tokens, position)
+        while position < len(tokens) and tokens[position] not in ("OR", ")"):
+            if tokens[position] == "AND":
+                position += 1
+            right, position = self._parse_not(tokens, position)
+            result = result & right
+        return result, position
+
+    def _parse_not(self, tokens: list, position: int) -> tuple:
+        if position >= len(tokens):
+            raise ValueError("Tag query is incomplete")
+        token = tokens[position]
+        if token == "NOT":
+            operand, position = self._parse_not(tokens, position + 1)
+            return set(self.tags) - operand, position
+        if token == "(":
+            result, position = self._parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError("Missing ')' in tag query")
+            return result, position + 1
+        if token in self.OPERATORS:
+            raise ValueError(f"Unexpected '{token}' in tag query")
+        return set(self.titles.get(token, ())), position + 1
+
+
+class TitleIndex(PrefixSet):
+    """Note titles for prefix completion"""
+
+    def add(self, title: str, note: dict) -> None:
+        self.insert(title)
+
+    def remove(self, title: str) -> None:
+        self.discard(title)
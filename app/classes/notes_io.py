@@ -0,0 +1,120 @@
+"""Module providing streaming readers and writers of notes files.
+
+Supported formats by file extension:
+  .json  - object of title -> note, the format of notes.json
+  .jsonl - one {"title", "content", "tags"} object per line
+  .csv   - title, content, tags columns, tags are separated with ';'
+  .txt   - blocks of 'Title:' and 'Tags:' lines, 'Encrypted: yes' line for encrypted
+           note, and content, ended with '---' line
+"""
+
+import csv
+import json
+import os
+from app.classes.safe_files import atomic_write
+
+FORMATS = (".json", ".jsonl", ".csv", ".txt")
+TXT_SEPARATOR = "---"
+TXT_ENCRYPTED = "Encrypted: yes"
+CSV_FIELDS = ["title", "content", "tags", "encrypted"]
+
+
+def note_format(file_path: str) -> str:
+    """Return format of notes file by extension, raise ValueError for unknown one"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported notes file format '{extension}', use {', '.join(FORMATS)}")
+    return extension
+
+
+def _note(content: str, tags, encrypted=False) -> dict:
+    note = {"content": content, "tags": list(dict.fromkeys(tags))}
+    if encrypted:
+        note["encrypted"] = True
+    return note
+
+
+def read_notes(file_path: str):
+    """Yield (title, note) pairs from notes file one by one"""
+    extension = note_format(file_path)
+    with open(file_path, "r", encoding="utf-8", newline="" if extension == ".csv" else None) as file:
+        if extension == ".json":
+            # Plain json object can not be read partially
+            for title, note in json.load(file).items():
+                yield title, _note(note["content"], note.get("tags", []), note.get("encrypted"))
+        elif extension == ".jsonl":
+            for line in file:
+                if line.strip():
+                    item = json.loads(line)
+                    yield item["title"], _note(item["content"], item.get("tags", []), item.get("encrypted"))
+        elif extension == ".csv":
+            for row in csv.DictReader(file):
+                tags = [tag for tag in (row.get("tags") or "").split(";") if tag]
+                yield row["title"], _note(row.get("content") or "", tags, row.get("encrypted") == "1")
+        else:
+            yield from _read_txt(file)
+
+
+def _read_txt(file):
+    title, tags, encrypted, lines = None, None, False, []
+    for line in file:
+        line = line.rstrip("\n")
+        if title is None:
+            if line.startswith("Title: "):
+                title = line[len("Title: "):]
+        elif tags is None:
+            tags = [tag.strip() for tag in line[len("Tags:"):].split(",") if tag.strip()]
+        elif line == TXT_ENCRYPTED and not lines and not encrypted:
+            encrypted = True
+        elif line == TXT_SEPARATOR:
+            yield title, _note("\n".join(lines), tags, encrypted)
+            title, tags, encrypted, lines = None, None, False, []
+        else:
+            # Writer escapes content lines starting with separator, encrypted flag or backslash
+            lines.append(line[1:] if line.startswith("\\") else line)
+    if title is not None:
+        yield title, _note("\n".join(lines), tags or [], encrypted)
+
+
+def _escape_txt_line(line: str) -> str:
+    return "\\" + line if line.startswith((TXT_SEPARATOR, TXT_ENCRYPTED, "\\")) else line
+
+
+def write_notes(file_path: str, notes, progress=None) -> int:
+    """Write (title, note) pairs to notes file one by one, return number of written notes.
+
+    File is replaced only when all notes are written.
+    progress is called with number of notes written so far after every note.
+    """
+    extension = note_format(file_path)
+    count = 0
+    with atomic_write(file_path, "w", encoding="utf-8", newline="" if extension == ".csv" else None) as file:
+        if extension == ".csv":
+            writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+        elif extension == ".json":
+            file.write("{")
+
+        for title, note in notes:
+            if extension == ".json":
+                file.write(f"{', ' if count else ''}{json.dumps(title)}: {json.dumps(note)}")
+            elif extension == ".jsonl":
+                file.write(json.dumps({"title": title, **note}, ensure_ascii=False) + "\n")
+            elif extension == ".csv":
+                writer.writerow({
+                    "title": title,
+                    "content": note["content"],
+                    "tags": ";".join(note["tags"]),
+                    "encrypted": "1" if note.get("encrypted") else "",
+                })
+            else:
+                content = "\n".join(_escape_txt_line(line) for line in note["content"].split("\n"))
+                flag = f"{TXT_ENCRYPTED}\n" if note.get("encrypted") else ""
+                file.write(f"Title: {title}\nTags: {', '.join(note['tags'])}\n{flag}{content}\n{TXT_SEPARATOR}\n")
+            count += 1
+            if progress:
+                progress(count)
+
+        if extension == ".json":
+            file.write("}")
+    return count
@@ -1,59 +1,129 @@
 """Module providing record clas declaration for address book module."""
 
-from app.classes.basic_classes import Name, Phone, Birthday, Email, Address
+from app.classes.basic_classes import Slotted, Name, Phone, Birthday, Email, Address
 
-class Record:
+
+class Record(Slotted):
     """Record Class responsible for phone, birthday, email, and address management."""
+
+    # Phones are kept packed in one string of Phone.LENGTH digit chunks
+    __slots__ = ("name", "_phones", "birthday", "email", "addresses", "_book")
+
     def __init__(self, name: str):
         self.name = Name(name)
-        self.phones = []
+        self._phones = ""
         self.birthday = None
         self.email = None
         self.addresses = {}
+        self._book = None  # AddressBook which owns the record, set by AddressBook.add_record
+
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in self.__slots__ if key != "_book"}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1] or {}
+        state = dict(state)
+        if "phones" in state:
+            # Pickles made before phones were packed keep list of Phone objects
+            state["_phones"] = "".join(p.value for p in state.pop("phones"))
+        super().__setstate__(state)
+        self._book = None
+
+    @property
+    def phone_numbers(self) -> tuple:
+        """Phone numbers as strings"""
+        packed, size = self._phones, Phone.LENGTH
+        return tuple(packed[i:i + size] for i in range(0, len(packed), size))
+
+    @property
+    def phones(self) -> tuple:
+        """Phones as Phone fields, their update_number changes the record"""
+        return tuple(Phone.from_valid(number, self) for number in self.phone_numbers)
+
+    @phones.setter
+    def phones(self, phones) -> None:
+        """Replace all phones with Phone fields or numbers"""
+        numbers = [phone.value if isinstance(phone, Phone) else Phone(phone).value for phone in phones]
+        for number in numbers:
+            self._check_unique("phone", number)
+        self._phones = "".join(numbers)
+        self._changed()
+
+    def _changed(self) -> None:
+        """Notify owning address book that record data was changed"""
+        if self._book is not None:
+            self._book._record_changed(self)
+
+    def _check_unique(self, field: str, value: str) -> None:
+        """Let owning address book reject phone or email other contact has"""
+        if self._book is not None:
+            self._book._check_unique(self, field, value)
 
     def show_phones(self) -> str:
         """Show user phones"""
-        return f"{self.name.value} телефони: {'; '.join(p.value for p in self.phones)}"
+        return f"{self.name.value} телефони: {'; '.join(self.phone_numbers)}"
 
     def add_phone(self, phone: str) -> None:
         """Add phone to record"""
-        self.phones.append(Phone(phone))
+        phone = Phone(phone).value
+        self._check_unique("phone", phone)
+        self._phones += phone
+        self._changed()
 
     def remove_phone(self, phone: str) -> None:
         """Remove phone from record"""
-        self.phones = [p for p in self.phones if p.value != phone]
+        self._phones = "".join(p for p in self.phone_numbers if p != phone)
+        self._changed()
 
     def edit_phone(self, old_phone: str, new_phone: str) -> None:
         """Edit phone in record"""
-        phone = self.find_phone(old_phone)
-        if phone:
-            phone.update_number(new_phone)
+        if self.find_phone(old_phone):
+            new_phone = Phone(new_phone).value
+            self._check_unique("phone", new_phone)
+            self._phones = "".join(new_phone if p == old_phone else p for p in self.phone_numbers)
+            self._changed()
         else:
             raise ValueError("Не існує телефона, який ви бажаєте змінити")
 
     def find_phone(self, phone: str) -> Phone:
         """Find phone in record"""
-        for p in self.phones:
-            if p.value == phone:
-                return p
+        if phone in self.phone_numbers:
+            return Phone.from_valid(phone, self)
         return None
 
     def add_birthday(self, birthday: str) -> None:
         """Add birthday to record"""
         self.birthday = Birthday(birthday)
+        self._changed()
+
+    def remove_birthday(self) -> None:
+        """Remove birthday from record"""
+        self.birthday = None
+        self._changed()
 
     def add_email(self, email: str) -> None:
         """Add email to record"""
-        self.email = Email(email)
+        email = Email(email)
+        self._check_unique("email", email.value)
+        self.email = email
+        self._changed()
+
+    def remove_email(self) -> None:
+        """Remove email from record"""
+        self.email = None
+        self._changed()
 
     def add_address(self, label: str, address: str) -> None:
         """Add an address to the record."""
         self.addresses[label] = Address(label, address)
+        self._changed()
 
     def edit_address(self, label: str, new_address: str) -> None:
         """Edit an existing address."""
         if label in self.addresses:
             self.addresses[label].address = new_address
+            self._changed()
         else:
             raise ValueError(f"No address found with label '{label}'")
 
@@ -61,8 +131,19 @@ class Record:
         """Remove an address from the record by its label."""
         if label in self.addresses:
             del self.addresses[label]
+            self._changed()
         else:
-            print(f"No address found with label '{label}'")
+            raise ValueError(f"No address found with label '{label}'")
+
+    def merge(self, other: "Record") -> None:
+        """Add phones and addresses of other record, its email and birthday if this one has none"""
+        phones = self.phone_numbers
+        self._phones += "".join(dict.fromkeys(p for p in other.phone_numbers if p not in phones))
+        self.email = self.email or other.email
+        self.birthday = self.birthday or other.birthday
+        for label, address in other.addresses.items():
+            self.addresses.setdefault(label, address)
+        self._changed()
 
     def show_addresses(self) -> str:
         """Return a string representation of all addresses."""
@@ -70,8 +151,32 @@ class Record:
             return "No addresses"
         return "\n".join(f"{label}: {address.address}" for label, address in self.addresses.items())
 
+    def to_dict(self) -> dict:
+        """Return plain data representation of the record"""
+        return {
+            "name": self.name.value,
+            "phones": list(self.phone_numbers),
+            "birthday": str(self.birthday) if self.birthday else None,
+            "email": self.email.value if self.email else None,
+            "addresses": {label: address.address for label, address in self.addresses.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Record":
+        """Build record from data returned by to_dict"""
+        record = cls(data["name"])
+        record._phones = "".join(Phone(phone).value for phone in data.get("phones", []))
+        if data.get("birthday"):
+            record.birthday = Birthday(data["birthday"])
+        if data.get("email"):
+            record.email = Email(data["email"])
+        record.addresses = {
+            label: Address(label, address) for label, address in data.get("addresses", {}).items()
+        }
+        return record
+
     def __str__(self):
-        to_return = f"Контакт: {self.name.value}, телефони: {'; '.join(p.value for p in self.phones)}"
+        to_return = f"Контакт: {self.name.value}, телефони: {'; '.join(self.phone_numbers)}"
         if self.birthday:
             to_return += f", День народження: {self.birthday}"
         if self.email:
@@ -0,0 +1,69 @@
+"""Module providing atomic file writes and advisory locks shared by processes."""
+
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# New files get these mode bits less umask, kernel applies umask so it is never read
+NEW_FILE_MODE = 0o666
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold advisory lock on path while in context, shared lock lets other readers in.
+
+    Windows has no shared locks, there every lock is exclusive.
+    """
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def temp_file(path: str, mode: str = "w", **kwargs):
+    """Open new temp file in directory of path, it is fsync'd on close and removed on error"""
+    directory, name = os.path.split(os.path.abspath(path))
+    while True:
+        tmp_path = os.path.join(directory, f"{name}.{os.urandom(6).hex()}.tmp")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, NEW_FILE_MODE)
+            break
+        except FileExistsError:
+            continue
+    os.close(fd)
+    try:
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            pass
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w", **kwargs):
+    """Write file through temp file, path is replaced only after writing succeeded"""
+    with temp_file(path, mode, **kwargs) as f:
+        yield f
+    os.replace(f.name, path)
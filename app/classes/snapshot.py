@@ -0,0 +1,344 @@
+"""Module providing binary address book snapshot opened with mmap.
+
+Layout, all numbers are little-endian:
+
+    header    magic, version, flags, count, generation, table offset, pool offset
+    records   per record: utf-8 name followed by encoded record, sorted by name
+    pool      u32 count, then u32 length + utf-8 of every address label
+    table     per record: u64 chunk offset, u32 name length, u32 record length
+
+Encoded record is birthday ordinal (0 if none), lengths of packed phones and
+email, number of addresses, then phones, email and (label index, length,
+address) of every address. Opening reads only header and pool, records are
+decoded when looked up and pages nobody touches are never read.
+"""
+
+import heapq
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+from collections.abc import MutableMapping
+from datetime import date
+from itertools import chain, islice
+from operator import itemgetter
+from app.classes.basic_classes import Address, Birthday, Email, Name
+from app.classes.record import Record
+
+MAGIC = b"PIPBOOK\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIQQQ")
+ENTRY = struct.Struct("<QII")
+RECORD = struct.Struct("<iIIH")
+ADDRESS = struct.Struct("<II")
+LENGTH = struct.Struct("<I")
+
+
+def encode_record(record: Record, label_ids: dict, labels: list) -> bytes:
+    """Encode record, labels missing in pool are appended to it"""
+    phones = record._phones.encode()
+    email = record.email.value.encode() if record.email else b""
+    parts = [
+        RECORD.pack(
+            record.birthday.value.toordinal() if record.birthday else 0,
+            len(phones), len(email), len(record.addresses),
+        ),
+        phones, email,
+    ]
+    for label, address in record.addresses.items():
+        label_id = label_ids.get(label)
+        if label_id is None:
+            label_id = label_ids[label] = len(labels)
+            labels.append(label)
+        text = address.address.encode()
+        parts += [ADDRESS.pack(label_id, len(text)), text]
+    return b"".join(parts)
+
+
+def decode_record(name: str, buffer, offset: int, labels: list) -> Record:
+    """Build record from encoded bytes, values were validated before they were saved"""
+    birthday, phones_length, email_length, addresses = RECORD.unpack_from(buffer, offset)
+    offset += RECORD.size
+    record = Record.__new__(Record)
+    record.name = Name.from_valid(name)
+    record._phones = buffer[offset:offset + phones_length].decode()
+    offset += phones_length
+    record.email = Email.from_valid(buffer[offset:offset + email_length].decode()) if email_length else None
+    offset += email_length
+    record.birthday = Birthday.from_valid(date.fromordinal(birthday)) if birthday else None
+    record.addresses = {}
+    for _ in range(addresses):
+        label_id, length = ADDRESS.unpack_from(buffer, offset)
+        offset += ADDRESS.size
+        label = labels[label_id]
+        record.addresses[label] = Address(label, buffer[offset:offset + length].decode())
+        offset += length
+    record._book = None
+    return record
+
+
+class SnapshotRecords(MutableMapping):
+    """Mapping of name to Record over mmapped snapshot.
+
+    Records are decoded on first access and kept, changed and new records
+    live in memory, deleted names are remembered until the next snapshot.
+    """
+
+    def __init__(self, buffer, count: int, table_offset: int, labels: list, book=None):
+        self.buffer = buffer
+        self.count = count
+        self.table_offset = table_offset
+        self.labels = labels
+        self.book = book
+        self._records = {}  # decoded, changed and new records
+        self._new = {}  # names missing in snapshot, ordered set
+        self._deleted = set()  # snapshot names deleted since opening
+        self._dropped = set()  # new names deleted since opening, newer snapshot may have them
+
+    def close(self) -> None:
+        """Release mapped snapshot file, records not decoded yet can not be read after it"""
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _entry(self, position: int) -> tuple:
+        return ENTRY.unpack_from(self.buffer, self.table_offset + position * ENTRY.size)
+
+    def _name(self, position: int) -> str:
+        offset, name_length, _ = self._entry(position)
+        return self.buffer[offset:offset + name_length].decode()
+
+    def _bisect(self, name: str, right: bool = False) -> int:
+        """Position to insert name at among sorted snapshot names"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found = self._name(middle)
+            if found < name or right and found == name:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, name: str):
+        """Position of name in snapshot or None"""
+        position = self._bisect(name)
+        if position < self.count and self._name(position) == name:
+            return position
+        return None
+
+    def page(self, after: str = None, size: int = 20) -> tuple:
+        """Return up to size names following after in name order and whether more names follow.
+
+        Names are read off the sorted snapshot, records are not decoded.
+        """
+        start = self._bisect(after, right=True) if after is not None else 0
+
+        def snapshot_names():
+            for position in range(start, self.count):
+                name = self._name(position)
+                if name not in self._deleted:
+                    yield name
+
+        new = sorted(name for name in self._new if after is None or name > after)
+        names = list(islice(heapq.merge(snapshot_names(), new), size + 1))
+        return names[:size], len(names) > size
+
+    def _decode(self, position: int, name: str) -> Record:
+        offset, name_length, _ = self._entry(position)
+        record = decode_record(name, self.buffer, offset + name_length, self.labels)
+        record._book = self.book
+        # Concurrent readers get the same record object
+        return self._records.setdefault(name, record)
+
+    def __getitem__(self, name: str) -> Record:
+        record = self._records.get(name)
+        if record is not None:
+            return record
+        if name in self._deleted:
+            raise KeyError(name)
+        position = self._find(name)
+        if position is None:
+            raise KeyError(name)
+        return self._decode(position, name)
+
+    def __contains__(self, name) -> bool:
+        if name in self._records:
+            return True
+        return name not in self._deleted and self._find(name) is not None
+
+    def __setitem__(self, name: str, record: Record) -> None:
+        if name not in self._records:
+            if name in self._deleted:
+                self._deleted.discard(name)
+            elif self._find(name) is None:
+                self._new[name] = None
+        self._records[name] = record
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self._records.pop(name, None)
+        if name in self._new:
+            del self._new[name]
+            self._dropped.add(name)
+        else:
+            self._deleted.add(name)
+
+    def __len__(self) -> int:
+        return self.count - len(self._deleted) + len(self._new)
+
+    def _snapshot_names(self):
+        """Yield (position, name) of snapshot records in name order"""
+        table = self.buffer[self.table_offset:self.table_offset + self.count * ENTRY.size]
+        for position, (offset, name_length, _) in enumerate(ENTRY.iter_unpack(table)):
+            yield position, self.buffer[offset:offset + name_length].decode()
+
+    def __iter__(self):
+        for _, name in self._snapshot_names():
+            if name not in self._deleted:
+                yield name
+        yield from list(self._new)
+
+    def items(self):
+        """Yield (name, record) pairs, snapshot records are decoded by position without lookup"""
+        for position, name in self._snapshot_names():
+            record = self._records.get(name)
+            if record is None and name not in self._deleted:
+                record = self._decode(position, name)
+            if record is not None:
+                yield name, record
+        for name in list(self._new):
+            yield name, self._records[name]
+
+    def values(self):
+        return (record for _, record in self.items())
+
+    def encoded(self, label_ids: dict, labels: list):
+        """Yield (name, encoded record) in name order, untouched records are copied as they are"""
+        def untouched():
+            for position, name in self._snapshot_names():
+                if name not in self._records and name not in self._deleted:
+                    offset, name_length, record_length = self._entry(position)
+                    start = offset + name_length
+                    yield name, self.buffer[start:start + record_length]
+
+        touched = (
+            (name, encode_record(self._records[name], label_ids, labels))
+            for name in sorted(self._records)
+        )
+        return heapq.merge(untouched(), touched, key=itemgetter(0))
+
+    def _present(self, names: list) -> set:
+        """Names which snapshot has, few are looked up, many are merged with all snapshot names"""
+        if len(names) * 16 < self.count:
+            return {name for name in names if self._find(name) is not None}
+        names = set(names)
+        return {name for _, name in self._snapshot_names() if name in names}
+
+    def take_changes(self, old) -> None:
+        """Take changes of the same book over older snapshot, so this mapping has contents of old one.
+
+        Snapshot records old has not touched are the same in both snapshots,
+        so only changed and deleted names are compared with this snapshot.
+        """
+        deleted = [name for name in old._deleted | old._dropped if name not in old._records]
+        present = self._present([*old._records, *deleted])
+        for name in chain(old._new, old._records):
+            if name not in self._records:
+                self._records[name] = old._records[name]
+                if name not in present:
+                    self._new[name] = None
+        self._deleted.update(name for name in deleted if name in present)
+
+    def __reduce__(self):
+        # Pickled book gets plain dict of decoded records
+        return dict, (dict(self.items()),)
+
+
+def encode_book(book) -> tuple:
+    """(generation, labels, (name, encoded record) pairs) of book, records are encoded lazily"""
+    data = book.data
+    if isinstance(data, SnapshotRecords):
+        # Old label ids stay valid, so untouched records are copied
+        labels = list(data.labels)
+        label_ids = {label: i for i, label in enumerate(labels)}
+        records = data.encoded(label_ids, labels)
+    else:
+        labels, label_ids = [], {}
+        records = ((name, encode_record(data[name], label_ids, labels)) for name in sorted(data))
+    return book.generation, labels, records
+
+
+def write_snapshot(file, book, encoded=None) -> None:
+    """Write book, or its copy from encode_book, to binary file opened for writing"""
+    generation, labels, records = encoded or encode_book(book)
+
+    file.write(b"\0" * HEADER.size)
+    offset = HEADER.size
+    offsets, lengths = array("Q"), array("I")
+    for name, encoded in records:
+        name = name.encode()
+        file.write(name)
+        file.write(encoded)
+        offsets.append(offset)
+        lengths.extend((len(name), len(encoded)))
+        offset += len(name) + len(encoded)
+
+    pool_offset = offset
+    file.write(LENGTH.pack(len(labels)))
+    for label in labels:
+        label = label.encode()
+        file.write(LENGTH.pack(len(label)) + label)
+        offset += LENGTH.size + len(label)
+    table_offset = offset + LENGTH.size
+    for i, chunk_offset in enumerate(offsets):
+        file.write(ENTRY.pack(chunk_offset, lengths[2 * i], lengths[2 * i + 1]))
+
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, VERSION, 0, len(offsets), generation, table_offset, pool_offset))
+
+
+def _read_labels(buffer, offset: int) -> list:
+    (count,) = LENGTH.unpack_from(buffer, offset)
+    offset += LENGTH.size
+    labels = []
+    for _ in range(count):
+        (length,) = LENGTH.unpack_from(buffer, offset)
+        offset += LENGTH.size
+        labels.append(buffer[offset:offset + length].decode())
+        offset += length
+    return labels
+
+
+def read_snapshot(file_path: str):
+    """Open book snapshot, pickles of older versions are loaded whole"""
+    from app.classes.address_book import AddressBook
+
+    with open(file_path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            book = pickle.load(f)
+            if not isinstance(book, AddressBook):
+                raise ValueError("Error reading saved data")
+            return book
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        _, version, _, count, generation, table_offset, pool_offset = HEADER.unpack_from(buffer)
+        if version > VERSION:
+            raise ValueError(f"Snapshot version {version} is newer than supported {VERSION}")
+        if table_offset + count * ENTRY.size > len(buffer):
+            raise ValueError("Snapshot file is truncated")
+        labels = [sys.intern(label) for label in _read_labels(buffer, pool_offset)]
+    except struct.error as e:
+        raise ValueError("Snapshot file is truncated") from e
+
+    book = AddressBook()
+    book.data = SnapshotRecords(buffer, count, table_offset, labels, book)
+    book.generation = generation
+    return book
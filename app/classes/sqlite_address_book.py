@@ -0,0 +1,307 @@
+"""Module providing SQLite storage backend for address book module."""
+
+import sqlite3
+from collections.abc import MutableMapping
+from datetime import date, datetime
+from app.classes.completion import COMPLETION_LIMIT
+from app.classes.address_book import AddressBook
+from app.classes.indexes import calendar_window, normalize_unique
+from app.classes.record import Record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    email TEXT,
+    birthday TEXT,
+    birth_md INTEGER
+);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email);
+CREATE INDEX IF NOT EXISTS contacts_email_lower ON contacts (lower(email));
+CREATE INDEX IF NOT EXISTS contacts_birth_md ON contacts (birth_md);
+CREATE TABLE IF NOT EXISTS phones (
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL,
+    phone_reversed TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_name ON phones (name);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+CREATE INDEX IF NOT EXISTS phones_phone_reversed ON phones (phone_reversed);
+CREATE TABLE IF NOT EXISTS addresses (
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    address TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS addresses_name ON addresses (name);
+CREATE INDEX IF NOT EXISTS addresses_address ON addresses (address);
+"""
+
+# Duplicates are looked up in indexed columns, values are compared normalized like normalize_unique
+UNIQUE_OWNERS = {
+    "phone": "SELECT name FROM phones WHERE phone = ?",
+    "email": "SELECT name FROM contacts WHERE lower(email) = ?",
+}
+UNIQUE_SHARED = {
+    "phone": "SELECT phone, name FROM phones WHERE phone IN "
+             "(SELECT phone FROM phones GROUP BY phone HAVING count(DISTINCT name) > 1)",
+    "email": "SELECT lower(email), name FROM contacts WHERE lower(email) IN "
+             "(SELECT lower(email) FROM contacts WHERE email IS NOT NULL GROUP BY lower(email) HAVING count(*) > 1)",
+}
+
+
+def _search_text(record: Record) -> str:
+    """Lowercased text of all record fields used by find_by_query"""
+    parts = [record.name.value]
+    if record.email:
+        parts.append(record.email.value)
+    parts.extend(record.phone_numbers)
+    parts.extend(address.address for address in record.addresses.values())
+    if record.birthday:
+        parts.append(str(record.birthday))
+    return "\n".join(parts).lower()
+
+
+class SQLiteRecords(MutableMapping):
+    """Mapping of name to Record stored in SQLite tables, records are built on access"""
+
+    def __init__(self, conn: sqlite3.Connection, book: AddressBook):
+        self.conn = conn
+        self.book = book
+
+    def __getitem__(self, name: str) -> Record:
+        row = self.conn.execute(
+            "SELECT email, birthday FROM contacts WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        email, birthday = row
+        phones = [p for (p,) in self.conn.execute(
+            "SELECT phone FROM phones WHERE name = ? ORDER BY position", (name,)
+        )]
+        addresses = dict(self.conn.execute(
+            "SELECT label, address FROM addresses WHERE name = ? ORDER BY rowid", (name,)
+        ).fetchall())
+        birthday = datetime.strptime(birthday, "%Y-%m-%d").strftime("%d.%m.%Y") if birthday else None
+        record = Record.from_dict({
+            "name": name, "phones": phones, "email": email,
+            "birthday": birthday, "addresses": addresses,
+        })
+        record._book = self.book
+        return record
+
+    def __setitem__(self, name: str, record: Record) -> None:
+        with self.conn:
+            self._write(name, record)
+
+    def put_many(self, records: list) -> None:
+        """Write many records in one transaction"""
+        with self.conn:
+            for record in records:
+                self._write(record.name.value, record)
+
+    def _write(self, name: str, record: Record) -> None:
+        birthday = record.birthday.value if record.birthday else None
+        self._remove(name)
+        self.conn.executemany(
+            "INSERT INTO phones (name, position, phone, phone_reversed) VALUES (?, ?, ?, ?)",
+            [(name, i, phone, phone[::-1]) for i, phone in enumerate(record.phone_numbers)],
+        )
+        self.conn.executemany(
+            "INSERT INTO addresses (name, label, address) VALUES (?, ?, ?)",
+            [(name, label, address.address) for label, address in record.addresses.items()],
+        )
+        cursor = self.conn.execute(
+            "INSERT INTO contacts (name, email, birthday, birth_md) VALUES (?, ?, ?, ?)",
+            (
+                name,
+                record.email.value if record.email else None,
+                birthday.isoformat() if birthday else None,
+                birthday.month * 100 + birthday.day if birthday else None,
+            ),
+        )
+        # Search row shares rowid with contact id
+        self.conn.execute(
+            "INSERT INTO contacts_search (rowid, search_text) VALUES (?, ?)",
+            (cursor.lastrowid, _search_text(record)),
+        )
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        with self.conn:
+            self._remove(name)
+
+    def _remove(self, name: str) -> None:
+        self.conn.execute(
+            "DELETE FROM contacts_search WHERE rowid = (SELECT id FROM contacts WHERE name = ?)",
+            (name,),
+        )
+        for table in ("contacts", "phones", "addresses"):
+            self.conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+
+    def __contains__(self, name) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM contacts WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        # Separate cursor so records can be loaded while iterating
+        for (name,) in self.conn.cursor().execute("SELECT name FROM contacts ORDER BY id"):
+            yield name
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+
+
+class SQLiteAddressBook(AddressBook):
+    """AddressBook which keeps records in SQLite file instead of memory"""
+
+    def __init__(self, filename: str = "addressbook.db"):
+        super().__init__()
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._fts = True
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_search "
+                "USING fts5(search_text, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5, search falls back to table scan
+            self._fts = False
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS contacts_search (search_text TEXT)"
+            )
+        self.data = SQLiteRecords(self.conn, self)
+
+    def __getstate__(self):
+        raise TypeError("SQLiteAddressBook is stored in its database and can not be pickled")
+
+    def add_record(self, record: Record) -> None:
+        record._book = self
+        self._record_changed(record)
+
+    def _record_changed(self, record: Record) -> None:
+        self.data[record.name.value] = record
+        for index in self._indexes.values():
+            index.add(record)
+
+    def add_records(self, records: list) -> None:
+        for record in records:
+            record._book = self
+            for index in self._indexes.values():
+                index.add(record)
+        self.data.put_many(records)
+
+    def _index(self, key: str):
+        # Only indexes filled from columns without loading records are kept in memory,
+        # other lookups are overridden with queries
+        if key not in self._indexes:
+            if key == "birthday:array":
+                index = self.INDEXES[key]()
+                rows = self.conn.execute("SELECT name, birthday FROM contacts WHERE birthday IS NOT NULL")
+                for name, birthday in rows:
+                    index.add_birthday(name, date.fromisoformat(birthday))
+            elif key == "fuzzy":
+                index = self.INDEXES[key]()
+                for (name,) in self.conn.execute("SELECT name FROM contacts"):
+                    index.add_name(name)
+            else:
+                raise NotImplementedError(f"Index '{key}' is not kept in memory for SQLite book, query the database")
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def _owners(self, field: str, value: str) -> set:
+        return {name for (name,) in self.conn.execute(UNIQUE_OWNERS[field], (normalize_unique(value),))}
+
+    def find_duplicates(self) -> list:
+        shared = {}
+        for field, query in UNIQUE_SHARED.items():
+            for value, name in self.conn.execute(query):
+                shared.setdefault((field, value), set()).add(name)
+        return sorted((field, value, sorted(names)) for (field, value), names in shared.items())
+
+    def find(self, name: str) -> Record:
+        try:
+            return self.data[name]
+        except KeyError:
+            return None
+
+    def complete_names(self, prefix: str) -> list:
+        # Range over unique name index, text compares by code points like str
+        rows = self.conn.execute(
+            "SELECT name FROM contacts WHERE name >= ? AND name < ? ORDER BY name LIMIT ?",
+            (prefix, prefix + "\U0010ffff", COMPLETION_LIMIT),
+        ).fetchall()
+        return [name for (name,) in rows]
+
+    def find_by_query(self, query: str) -> list:
+        """Search query data in any field"""
+        query = query.lower()
+        if self._fts and len(query) >= 3:
+            # Trigram index resolves substring as a phrase of its trigrams
+            condition, param = "contacts_search MATCH ?", '"' + query.replace('"', '""') + '"'
+        else:
+            condition, param = "instr(contacts_search.search_text, ?) > 0", query
+        rows = self.conn.execute(
+            "SELECT contacts.name FROM contacts_search "
+            "JOIN contacts ON contacts.id = contacts_search.rowid "
+            f"WHERE {condition} ORDER BY contacts.id",
+            (param,),
+        ).fetchall()
+        return [self.data[name] for (name,) in rows]
+
+    def get_page(self, cursor=None, page_size: int = 20, sort_key: str = "name") -> tuple:
+        if sort_key not in self.SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort_key}'")
+        key = "name" if sort_key == "name" else "COALESCE(birth_md, 9999)"
+        condition, params = ("WHERE (sort_key, name) > (?, ?)", cursor) if cursor else ("", ())
+        rows = self.conn.execute(
+            f"SELECT sort_key, name FROM (SELECT {key} AS sort_key, name FROM contacts) "
+            f"{condition} ORDER BY sort_key, name LIMIT ?",
+            (*params, page_size + 1),
+        ).fetchall()
+        next_cursor = tuple(rows[page_size - 1]) if len(rows) > page_size else None
+        return [self.data[name] for _, name in rows[:page_size]], next_cursor
+
+    def _find_by_phone_column(self, column: str, prefix: str, exact: bool = False) -> list:
+        if exact:
+            condition, params = f"{column} = ?", (prefix,)
+        else:
+            # Phones are digits only, so prefix range ends before prefix followed by ':'
+            condition, params = f"{column} >= ? AND {column} < ?", (prefix, prefix + ":")
+        rows = self.conn.execute(
+            f"SELECT name FROM phones WHERE {condition} ORDER BY {column}", params
+        ).fetchall()
+        return [self.data[name] for name in dict.fromkeys(name for (name,) in rows)]
+
+    def find_by_phone(self, phone: str) -> list:
+        return self._find_by_phone_column("phone", phone, exact=True)
+
+    def find_by_phone_prefix(self, prefix: str) -> list:
+        return self._find_by_phone_column("phone", prefix)
+
+    def find_by_phone_suffix(self, suffix: str) -> list:
+        return self._find_by_phone_column("phone_reversed", suffix[::-1])
+
+    def _birthdays_in_period(self, period: int):
+        days = {
+            month * 100 + day: celebrated
+            for (month, day), celebrated in calendar_window(datetime.today().date(), period).items()
+        }
+        if not days:
+            return
+        rows = self.conn.execute(
+            f"SELECT name, birth_md FROM contacts "
+            f"WHERE birth_md IN ({', '.join('?' * len(days))}) ORDER BY id",
+            list(days),
+        )
+        for name, birth_md in rows:
+            yield name, days[birth_md]
+
+    def close(self) -> None:
+        """Close database connection"""
+        self.conn.close()
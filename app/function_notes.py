@@ -1,129 +1,425 @@
+import getpass
 import json
 import os
-from cryptography.fernet import Fernet
+from app.classes.autosave import waiting_for_input
 from app.classes.localization import trans  # Assuming trans is defined in localization module
-from app.visualiser import show_note_table
+from app.classes.metrics import metrics
+from app.classes.notes_crypto import PASSPHRASE_ENV, load_cipher
+from app.classes.notes_io import read_notes, write_notes
+from app.classes.safe_files import file_lock
+from app.classes.notes_indexes import NotesSearchIndex, TagIndex, TitleIndex
+from app.visualiser import show_note_table, show_notes_search_table, show_tag_counts_table
+
+# What import does with a title which is already in notes
+MERGE_POLICIES = ("overwrite", "skip", "rename")
+# Import and export print progress every PROGRESS_STEP notes
+PROGRESS_STEP = 10000
+
 
 class NotesManager:
     """NotesManager class."""
+
+    # Indexes are built on first use and then kept in sync with notes
+    INDEXES = {
+        "search": NotesSearchIndex,
+        "tags": TagIndex,
+        "titles": TitleIndex,
+    }
     
-    def __init__(self):
-        """__init__ function."""
+    def __init__(self, key_file="notes.key", interactive=True):
+        """__init__ function, batch mode and server pass interactive=False, then nothing is asked on terminal."""
         self.notes = {}
-        self.key = Fernet.generate_key()
-        self.cipher_suite = Fernet(self.key)
+        self.key_file = key_file
+        self.interactive = interactive
+        self._cipher_suite = None
+        self._indexes = {}
+        # Notes file version and notes as they were loaded, for merge on save
+        self._version = None
+        self._base = {}
+        # Change counter and its value when notes were last saved
+        self.changes = 0
+        self._saved_changes = 0
+
+    def _index(self, key: str):
+        """Return index by key, building it from notes on first use."""
+        index = self._indexes.get(key)
+        if index is None:
+            index = self.INDEXES[key]()
+            for title, note in self.notes.items():
+                index.add(title, note)
+            self._indexes[key] = index
+        return index
+
+    def _note_changed(self, title: str) -> None:
+        """Update built indexes after note was added or changed."""
+        self.changes += 1
+        for index in self._indexes.values():
+            index.add(title, self.notes[title])
 
-    def _get_input(self, prompt: str) -> str:
-        """Private function to get user input with localization."""
-        localized_prompt = trans(prompt)
-        return input(f"{localized_prompt}: ").strip()
+    def _note_removed(self, title: str) -> None:
+        """Update built indexes after note was deleted."""
+        self.changes += 1
+        for index in self._indexes.values():
+            index.remove(title)
+
+    @property
+    def cipher_suite(self):
+        """Fernet cipher derived from passphrase on first encryption and kept for the session."""
+        if self._cipher_suite is None:
+            passphrase = os.environ.get(PASSPHRASE_ENV)
+            if not passphrase:
+                # Prompt in batch mode or server worker would block it and the lock it holds
+                if not self.interactive:
+                    raise ValueError("Notes passphrase is not set, set PIPBOY_NOTES_PASSPHRASE environment variable")
+                with waiting_for_input():
+                    passphrase = getpass.getpass(f"{trans('Enter notes passphrase')}: ")
+            self._cipher_suite = load_cipher(self.key_file, passphrase)
+        return self._cipher_suite
+
+    @metrics.timed("input")
+    def _get_input(self, prompt: str, **fields) -> str:
+        """Private function to get user input with localization, fields are formatted into translated prompt."""
+        localized_prompt = trans(prompt).format(**fields)
+        with waiting_for_input():
+            return input(f"{localized_prompt}: ").strip()
 
     def add_note(self, title=None, content=None):
         """add_note function."""
-        title = title or self._get_input("Enter note title")
-        content = content or self._get_input("Enter note content")
+        title = self._get_input("Enter note title") if title is None else title
+        content = content if content is not None else self._get_input("Enter note content")
         if title in self.notes:
             return trans("Note with title '{title}' already exists.").format(title=title)
         self.notes[title] = {"content": content, "tags": []}
+        self._note_changed(title)
         return trans("Note '{title}' added successfully.").format(title=title)
 
-    def edit_note(self, title=None):
+    def edit_note(self, title=None, content=None):
         """edit_note function."""
-        title = title or self._get_input("Enter note title to edit")
+        title = self._get_input("Enter note title to edit") if title is None else title
         if title not in self.notes:
             return trans("Note with title '{title}' does not exist.").format(title=title)
-        new_content = self._get_input("Enter new content")
+        new_content = content if content is not None else self._get_input("Enter new content")
         self.notes[title]["content"] = new_content
+        self._note_changed(title)
         return trans("Note '{title}' updated successfully.").format(title=title)
 
-    def delete_note(self, title=None):
-        """delete_note function."""
-        title = title or self._get_input("Enter note title to delete")
+    def delete_note(self, title=None, confirm=None):
+        """delete_note function, pass confirm='yes' to delete without asking."""
+        title = self._get_input("Enter note title to delete") if title is None else title
         if title not in self.notes:
             return trans("Note with title '{title}' does not exist.").format(title=title)
         
-        # Get the localized confirmation prompt and format it with the title
-        confirm_prompt = trans("Are you sure you want to delete note '{title}'? (yes/no)").format(title=title)
-        confirm = self._get_input(confirm_prompt).lower()
+        # Template is translated first and the title is formatted into it afterwards
+        if confirm is None:
+            confirm = self._get_input("Are you sure you want to delete note '{title}'? (yes/no)", title=title)
+        confirm = confirm.lower()
         
         if confirm == "yes":
             del self.notes[title]
+            self._note_removed(title)
             return trans("Note '{title}' deleted successfully.").format(title=title)
         
         return trans("Deletion cancelled.")
 
-    def search_notes_by_keyword(self, keyword=None):
-        """search_notes_by_keyword function."""
-        keyword = keyword or self._get_input("Enter keyword to search")
-        results = {title: note for title, note in self.notes.items() if keyword in note["content"]}
+    def search_notes_by_keyword(self, keyword=None, limit=10):
+        """Ranked search of notes by words, supports 'word1 word2' (AND) and 'word1 OR word2'."""
+        keyword = self._get_input("Enter keyword to search") if keyword is None else keyword
+        results = self.search(keyword, limit)
         if results:
-            return trans("Found notes {notes}").format(notes=', '.join(results.keys()))
+            return show_notes_search_table([
+                (title, score, NotesSearchIndex.snippet(self.notes[title]["content"], keyword))
+                for title, score in results
+            ])
         return trans("No notes found with the given keyword.")
 
+    @metrics.timed("search")
+    def search(self, query: str, limit=10) -> list:
+        """Return (title, score) of best matching notes, best first."""
+        return self._index("search").search(query, limit)
+
+    def complete_titles(self, prefix: str) -> list:
+        """Note titles starting with prefix, for tab completion."""
+        return self._index("titles").complete(prefix)
+
     def add_tag(self, title=None, tag=None):
         """add_tag function."""
-        title = title or self._get_input("Enter note title to add a tag")
+        title = self._get_input("Enter note title to add a tag") if title is None else title
         if title not in self.notes:
             return trans("Note with title '{title}' does not exist.").format(title=title)
-        tag = tag or self._get_input("Enter tag to add")
+        tag = self._get_input("Enter tag to add") if tag is None else tag
+        if tag in self.notes[title]["tags"]:
+            return trans("Note '{title}' already has tag '{tag}'.").format(tag=tag, title=title)
         self.notes[title]["tags"].append(tag)
+        self._note_changed(title)
         return trans("Tag '{tag}' added to note '{title}'.").format(tag=tag, title=title)
 
     def search_notes_by_tag(self, tag=None):
-        """search_notes_by_tag function."""
-        tag = tag or self._get_input("Enter tag to search")
-        results = {title: note for title, note in self.notes.items() if tag in note["tags"]}
-        if results:
-            return trans("Found notes with tag '{tag}' - {notes}").format(tag=tag, notes=', '.join(results.keys()))
+        """Search notes by tag or tag query like 'work AND urgent NOT done'."""
+        tag = self._get_input("Enter tag to search") if tag is None else tag
+        try:
+            found = self.find_by_tags(tag)
+        except ValueError as e:
+            return str(e)
+        if found:
+            return trans("Found notes with tag '{tag}' - {notes}").format(tag=tag, notes=', '.join(sorted(found)))
         return trans("No notes found with tag '{tag}'").format(tag=tag)
 
+    @metrics.timed("search")
+    def find_by_tags(self, tag_query: str) -> set:
+        """Return titles of notes matching tag query, raise ValueError for broken query."""
+        return self._index("tags").query(tag_query)
+
+    def tags(self) -> dict:
+        """Return number of notes for every tag."""
+        return self._index("tags").counts()
+
+    def tag_counts(self):
+        """Show number of notes for every tag."""
+        counts = self.tags()
+        if not counts:
+            return trans("No tags")
+        return show_tag_counts_table(counts)
+
     def encrypt_note(self, title=None):
         """encrypt_note function."""
-        title = title or self._get_input("Enter note title to encrypt")
+        title = self._get_input("Enter note title to encrypt") if title is None else title
         if title not in self.notes:
             return trans("Note with title '{title}' does not exist.").format(title=title)
-        content = self.notes[title]["content"].encode()
-        encrypted_content = self.cipher_suite.encrypt(content)
+        if self.notes[title].get("encrypted"):
+            return trans("Note '{title}' is already encrypted.").format(title=title)
+        try:
+            content = self.notes[title]["content"].encode()
+            encrypted_content = self.cipher_suite.encrypt(content)
+        except ValueError as e:
+            return trans(str(e), remember=False)
         self.notes[title]["content"] = encrypted_content.decode()
+        self.notes[title]["encrypted"] = True
+        self._note_changed(title)
         return trans("Note '{title}' encrypted successfully.").format(title=title)
 
     def decrypt_note(self, title=None):
         """decrypt_note function."""
-        title = title or self._get_input("Enter note title to decrypt")
+        title = self._get_input("Enter note title to decrypt") if title is None else title
         if title not in self.notes:
             return trans("Note with title '{title}' does not exist.").format(title=title)
         try:
             encrypted_content = self.notes[title]["content"].encode()
             decrypted_content = self.cipher_suite.decrypt(encrypted_content).decode()
             self.notes[title]["content"] = decrypted_content
+            self.notes[title].pop("encrypted", None)
+            self._note_changed(title)
             return trans("Note '{title}' decrypted successfully.").format(title=title)
         except Exception as e:
             return trans("Failed to decrypt note '{title}': {error}").format(title=title, error=str(e))
 
-    def import_notes(self, file_path=None):
-        """import_notes function."""
-        file_path = file_path or self._get_input("Enter file path to import notes from (JSON/CSV/TXT)")
+    def _select_notes(self, tag_query: str) -> list:
+        """Titles of all notes or of notes matching tag query."""
+        if not tag_query:
+            return list(self.notes)
+        return sorted(self.find_by_tags(tag_query))
+
+    def _crypt_notes(self, titles: list, encrypt: bool) -> int:
+        """Encrypt or decrypt contents of notes on thread pool, return number of failed notes."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        cipher = self.cipher_suite
+        crypt = cipher.encrypt if encrypt else cipher.decrypt
+
+        def process(content):
+            try:
+                return crypt(content.encode()).decode()
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor() as pool:
+            results = list(pool.map(process, (self.notes[title]["content"] for title in titles)))
+
+        failed = 0
+        for title, content in zip(titles, results):
+            if content is None:
+                failed += 1
+                continue
+            self.notes[title]["content"] = content
+            if encrypt:
+                self.notes[title]["encrypted"] = True
+            else:
+                self.notes[title].pop("encrypted", None)
+            self._note_changed(title)
+        return failed
+
+    def crypt_all(self, tag_query: str, encrypt: bool) -> tuple:
+        """Encrypt or decrypt notes matching tag query (all notes if empty), return (done, failed)."""
+        titles = [t for t in self._select_notes(tag_query) if bool(self.notes[t].get("encrypted")) != encrypt]
+        failed = self._crypt_notes(titles, encrypt) if titles else 0
+        return len(titles) - failed, failed
+
+    def encrypt_all(self, tag_query=None):
+        """Encrypt all notes or notes matching tag query."""
+        if tag_query is None:
+            tag_query = self._get_input("Enter tag query (press Enter for all notes)")
+        try:
+            count, failed = self.crypt_all(tag_query, encrypt=True)
+        except ValueError as e:
+            return trans(str(e), remember=False)
+        return trans("Encrypted notes: {count}, failed: {failed}.").format(count=count, failed=failed)
+
+    def decrypt_all(self, tag_query=None):
+        """Decrypt all encrypted notes or encrypted notes matching tag query."""
+        if tag_query is None:
+            tag_query = self._get_input("Enter tag query (press Enter for all notes)")
+        try:
+            count, failed = self.crypt_all(tag_query, encrypt=False)
+        except ValueError as e:
+            return trans(str(e), remember=False)
+        return trans("Decrypted notes: {count}, failed: {failed}.").format(count=count, failed=failed)
+
+    def _progress(self, message: str):
+        """Return callback printing progress every PROGRESS_STEP notes."""
+        def report(count):
+            if count % PROGRESS_STEP == 0:
+                print(f"\r{trans(message).format(count=count)}", end="", flush=True)
+        return report
+
+    def import_notes(self, file_path=None, policy=None):
+        """Import notes from JSON/JSONL/CSV/TXT file note by note.
+
+        policy decides what to do with title already in notes: overwrite, skip or rename.
+        """
+        if file_path is None:
+            file_path = self._get_input("Enter file path to import notes from (JSON/JSONL/CSV/TXT)")
+            policy = policy or self._get_input("Existing titles: overwrite, skip or rename (press Enter to overwrite)")
+        policy = policy or "overwrite"
+        if policy not in MERGE_POLICIES:
+            return trans("Unknown merge policy '{policy}'.").format(policy=policy)
         if not os.path.exists(file_path):
             return trans("File does not exist.")
         try:
-            if file_path.endswith(".json"):
-                with open(file_path, "r") as file:
-                    imported_notes = json.load(file)
-                    self.notes.update(imported_notes)
-            return trans("Notes imported successfully.")
+            imported, skipped = self.import_from_file(file_path, policy, self._progress("Imported notes: {count}"))
         except Exception as e:
             return trans("Failed to import notes: {error}").format(error=str(e))
+        if imported >= PROGRESS_STEP:
+            print()
+        return trans("Notes imported successfully.") + " " + trans(
+            "Imported: {imported}, skipped: {skipped}."
+        ).format(imported=imported, skipped=skipped)
+
+    def import_from_file(self, file_path: str, policy="overwrite", progress=None) -> tuple:
+        """Read notes from file merging them with policy, return (imported, skipped)."""
+        if policy not in MERGE_POLICIES:
+            raise ValueError(f"Unknown merge policy '{policy}'")
+        imported = skipped = 0
+        for title, note in read_notes(file_path):
+            if title in self.notes:
+                if policy == "skip":
+                    skipped += 1
+                    continue
+                if policy == "rename":
+                    title = self._free_title(title)
+            self.notes[title] = note
+            self._note_changed(title)
+            imported += 1
+            if progress:
+                progress(imported)
+        return imported, skipped
+
+    def _free_title(self, title: str) -> str:
+        """Return title with first free number suffix, like 'title (2)'."""
+        number = 2
+        while f"{title} ({number})" in self.notes:
+            number += 1
+        return f"{title} ({number})"
 
     def export_notes(self, file_path=None):
-        """export_notes function."""
-        file_path = file_path or self._get_input("Enter file path to export notes to (JSON/CSV/TXT)")
+        """Export notes to JSON/JSONL/CSV/TXT file note by note."""
+        file_path = self._get_input("Enter file path to export notes to (JSON/JSONL/CSV/TXT)") if file_path is None else file_path
         try:
-            if file_path.endswith(".json"):
-                with open(file_path, "w") as file:
-                    json.dump(self.notes, file)
-            return trans("Notes exported successfully.")
+            count = write_notes(file_path, self.notes.items(), self._progress("Exported notes: {count}"))
         except Exception as e:
             return trans("Failed to export notes: {error}").format(error=str(e))
+        if count >= PROGRESS_STEP:
+            print()
+        return trans("Notes exported successfully.")
+
+    @staticmethod
+    def _file_version(file_path: str):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _snapshot(self) -> dict:
+        """Copy of notes, contents are shared as strings are not changed in place."""
+        return {title: {**note, "tags": list(note["tags"])} for title, note in self.notes.items()}
+
+    @metrics.timed("load")
+    def load_notes_file(self, file_path="notes.json"):
+        """Load notes kept between sessions and remember their version."""
+        if os.path.exists(file_path):
+            with file_lock(f"{file_path}.lock", shared=True):
+                self._version = self._file_version(file_path)
+                for title, note in read_notes(file_path):
+                    self.notes[title] = note
+                    self._note_changed(title)
+        self._base = self._snapshot()
+        self._saved_changes = self.changes
+
+    @property
+    def dirty(self) -> bool:
+        """True if notes were changed since they were loaded or saved."""
+        return self.changes != self._saved_changes
+
+    @metrics.timed("save")
+    def save_notes_file(self, file_path="notes.json"):
+        """Save notes kept between sessions, merging changes saved meanwhile by other process."""
+        if not self.dirty and os.path.exists(file_path):
+            return
+        with file_lock(f"{file_path}.lock"):
+            if self._file_version(file_path) not in (None, self._version):
+                self._merge(dict(read_notes(file_path)))
+            write_notes(file_path, self.notes.items())
+            self._version = self._file_version(file_path)
+        self._base = self._snapshot()
+        self._saved_changes = self.changes
+
+    def autosave(self, file_path, lock) -> None:
+        """Save changed notes from autosave thread, lock stops commands while notes are copied."""
+        with lock:
+            if not self.dirty:
+                return
+            notes, changes, version = self._snapshot(), self.changes, self._version
+        with file_lock(f"{file_path}.lock"):
+            written = self._file_version(file_path) in (None, version)
+            if written:
+                write_notes(file_path, notes.items())
+                version = self._file_version(file_path)
+        with lock:
+            if not written:
+                # Other process saved notes meanwhile, merge them while commands wait
+                self.save_notes_file(file_path)
+                return
+            self._version, self._base, self._saved_changes = version, notes, changes
+
+    def _merge(self, theirs: dict) -> None:
+        """Three-way merge of saved notes into ours, both versions of a conflicting note are kept."""
+        base = self._base
+        for title in base.keys() | theirs.keys():
+            their_note, base_note = theirs.get(title), base.get(title)
+            if their_note == base_note:
+                continue
+            our_note = self.notes.get(title)
+            if their_note is None:
+                # They deleted note, it stays only if we changed it
+                if our_note is not None and our_note == base_note:
+                    del self.notes[title]
+                    self._note_removed(title)
+                continue
+            if our_note not in (None, base_note, their_note):
+                title = self._free_title(title)
+            elif our_note == their_note:
+                continue
+            self.notes[title] = their_note
+            self._note_changed(title)
 
     def save_notes(self):
         """save_notes function."""
@@ -146,7 +442,7 @@ class NotesManager:
     
     def show_note(self, title=None):
         """Show the content of a note by title using a table format."""
-        title = title or self._get_input("Enter note title to show")
+        title = self._get_input("Enter note title to show") if title is None else title
         note = self.notes.get(title)
         
         if not note:
@@ -1,13 +1,38 @@
 from functools import wraps
+import os
 import pickle
 from app.classes.address_book import AddressBook
+from app.classes.autosave import waiting_for_input
+from app.classes.contacts_import import import_contacts
 from app.classes.record import Record
+from app.classes.journal import Journal
+from app.classes.metrics import metrics
+from app.classes.safe_files import atomic_write, file_lock
+from app.classes.snapshot import encode_book, write_snapshot
+from app.classes.sqlite_address_book import SQLiteAddressBook
 from app.visualiser import (
-    show_contact_table, error_out, show_search_results_table, 
-    blue_input, blue_string
+    show_contact_table, error_out, show_search_results_table, show_stats_table, show_birthday_stats_table,
+    show_duplicates_table,
+    blue_input, blue_string, green_string, red_string
 )
 from app.classes.localization import trans
 
+# Address book file, *.db or *.sqlite files are opened with SQLite backend
+BOOK_FILE = os.environ.get("PIPBOY_BOOK_FILE", "addressbook.pkl")
+SQLITE_EXTENSIONS = (".db", ".sqlite")
+# Import prints only first bad rows, the rest are counted
+IMPORT_ERRORS_SHOWN = 20
+# Names offered when contact is not found
+SUGGESTIONS = 5
+
+
+class ContactNotFound(KeyError):
+    """Contact is not in address book, hint lists contacts with similar names"""
+
+    def __init__(self, hint: str = ""):
+        super().__init__(hint)
+        self.hint = hint
+
 
 def input_error(func):
     """Function to wrap user input handle errors."""
@@ -16,12 +41,14 @@ def input_error(func):
         """Inner function."""
         try:
             return func(*args, **kwargs)
-        except KeyError: 
+        except KeyError as e:
             print(f"""{error_out('No such user in address book')}""")
+            if isinstance(e, ContactNotFound) and e.hint:
+                print(green_string(e.hint))
         except IndexError: 
             print(f"""{error_out('Contact not found')}""")
         except ValueError as e:
-            print(f"""{error_out(str(e))}""")
+            print(f"""{error_out(e)}""")
     return inner
 
 
@@ -37,10 +64,31 @@ def get_contact_from_book(name, book: AddressBook) -> Record:
     """Function to find contact by name."""
     record = book.find(name)
     if not record:
-        raise KeyError
+        raise ContactNotFound(did_you_mean(book, name))
     return record
 
 
+def did_you_mean(book: AddressBook, query: str) -> str:
+    """Hint with names of contacts similar to query, empty if there are none."""
+    names = [record.name.value for record, _ in book.find_fuzzy(query, limit=SUGGESTIONS)]
+    if not names:
+        return ""
+    return trans("Did you mean: {names}?").format(names=", ".join(names))
+
+
+def warn_duplicates(duplicates: dict) -> None:
+    """Print phones and emails which other contacts also have."""
+    for (field, value), names in duplicates.items():
+        print(green_string(trans("{field} {value} also belongs to: {names}").format(
+            field=trans(field), value=value, names=", ".join(names))))
+
+
+def check_duplicates(record: Record, field: str, value: str) -> None:
+    """Warn after record got phone or email other contacts have."""
+    if record._book is not None:
+        warn_duplicates(record._book.duplicates_of(record, {field: (value,)}))
+
+
 @input_error
 def add_contact(book: AddressBook) -> str:
     """Process adding contact functionality (saving info step by step)."""
@@ -66,7 +114,11 @@ def add_contact(book: AddressBook) -> str:
             record = book.find(name) or Record(name)
             record.add_phone(phone)
             if name not in book.data:
-                book.add_record(record)
+                added, duplicates = book.add_unique(record)
+                warn_duplicates(duplicates)
+                if added is not record:
+                    print(green_string(trans("Contact merged into '{name}'").format(name=added.name.value)))
+                    return show_contact_table(added)
             phone_added = True
         except ValueError as e:
             print(f"""{error_out(e)}""")
@@ -80,6 +132,7 @@ def add_contact(book: AddressBook) -> str:
         else:
             try:
                 record.add_email(email)
+                check_duplicates(record, "email", email)
                 email_added = True
             except ValueError as e:
                 print(f"""{error_out(e)}""")
@@ -112,10 +165,12 @@ def add_contact(book: AddressBook) -> str:
 
 
 @input_error
-def edit_contact(book: AddressBook, exit_edit_mode) -> str:
+def edit_contact(book: AddressBook, exit_edit_mode, enter_edit_mode=None) -> str:
     """Contact edit functionality."""
     name = get_input("Enter name of contact")
     record = get_contact_from_book(name, book)
+    if enter_edit_mode:
+        enter_edit_mode()
     
     print(f"""\n{blue_string('Current contact information')}""")
     print(show_contact_table(record))
@@ -174,9 +229,10 @@ def modify_phone(record, action):
                     continue
                 record.add_phone(new_phone)
                 print(f"""{blue_string("Phone added successfully.")}""")
+                check_duplicates(record, "phone", new_phone)
                 break
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
     elif action == "change":
         while True:
@@ -195,9 +251,10 @@ def modify_phone(record, action):
                     continue
                 record.edit_phone(old_phone, new_phone)
                 print(f"""{blue_string("Phone updated successfully.")}""")
+                check_duplicates(record, "phone", new_phone)
                 break
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
     elif action == "delete":
         while True:
@@ -210,7 +267,7 @@ def modify_phone(record, action):
                 print(f"""{blue_string("Phone deleted successfully.")}""")
                 break
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
 
 
@@ -227,9 +284,10 @@ def modify_email(record, action):
                         continue
                     record.add_email(new_email)
                     print(f"""{blue_string("Email added successfully.")}""")
+                    check_duplicates(record, "email", new_email)
                     break
                 except ValueError as e:
-                    print(f"""{error_out(str(e))}""")
+                    print(f"""{error_out(e)}""")
 
     elif action == "change":
         if not record.email:
@@ -243,15 +301,16 @@ def modify_email(record, action):
                         continue
                     record.add_email(new_email)
                     print(f"""{blue_string("Email updated successfully.")}""")
+                    check_duplicates(record, "email", new_email)
                     break
                 except ValueError as e:
-                    print(f"""{error_out(str(e))}""")
+                    print(f"""{error_out(e)}""")
 
     elif action == "delete":
         if not record.email:
             print(error_out("No email to delete."))
         else:
-            record.email = None
+            record.remove_email()
             print(f"""{blue_string("Email deleted successfully.")}""")
 
 
@@ -270,7 +329,7 @@ def modify_birthday(record, action):
                     print(f"""{blue_string("Birthday added successfully.")}""")
                     break
                 except ValueError as e:
-                    print(f"""{error_out(str(e))}""")
+                    print(f"""{error_out(e)}""")
 
     elif action == "change":
         if not record.birthday:
@@ -286,13 +345,13 @@ def modify_birthday(record, action):
                     print(f"""{blue_string("Birthday updated successfully.")}""")
                     break
                 except ValueError as e:
-                    print(f"""{error_out(str(e))}""")
+                    print(f"""{error_out(e)}""")
 
     elif action == "delete":
         if not record.birthday:
             print(error_out("No birthday to delete."))
         else:
-            record.birthday = None
+            record.remove_birthday()
             print(f"""{blue_string("Birthday deleted successfully.")}""")
 
 
@@ -315,7 +374,7 @@ def modify_address(record, action):
                     print(f"""{blue_string("Address added successfully.")}""")
                 break
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
     elif action == "change":
         while True:
@@ -330,7 +389,7 @@ def modify_address(record, action):
                     break
 
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
         while True:
             try:
@@ -342,7 +401,7 @@ def modify_address(record, action):
                 print(f"""{blue_string("Address updated successfully.")}""")
                 break
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
     elif action == "delete":
         while True:
@@ -358,7 +417,7 @@ def modify_address(record, action):
                     print(f"""{blue_string("Address deleted successfully.")}""")
                 break
             except ValueError as e:
-                print(f"""{error_out(str(e))}""")
+                print(f"""{error_out(e)}""")
 
 
 
@@ -367,13 +426,22 @@ def modify_address(record, action):
 def upcoming_birthdays(book: AddressBook) -> str:
     """Upcoming birthdays function."""
     period = int(get_input("Enter period in days to show birthdays"))
-    return book.show_upcoming_birthdays(period)
+    with metrics.phase("search"):
+        return book.show_upcoming_birthdays(period)
+
+
+def birthday_stats(book: AddressBook) -> str:
+    """Show birthday statistics of the whole address book."""
+    with metrics.phase("search"):
+        report = book.birthday_stats()
+    return show_birthday_stats_table(report)
 
 
 @input_error
 def remove_contact(book: AddressBook) -> str:
     """Remove contact function."""
     name = get_input("Enter name of contact")
+    get_contact_from_book(name, book)
     book.delete(name)
     return trans("Contact removed")
 
@@ -389,26 +457,118 @@ def show_contact(book: AddressBook) -> str:
 @input_error
 def find_contact(address_book: AddressBook) -> None:
     """Function to find data in record data."""
-    query = input("Enter search query: ")
-    results = address_book.find_by_query(query)
+    with metrics.phase("input"), waiting_for_input():
+        query = input("Enter search query: ")
+    with metrics.phase("search"):
+        results = address_book.find_by_query(query)
+    print(show_search_results_table(results, query))
+    if not results and (hint := did_you_mean(address_book, query)):
+        print(green_string(hint))
+
+
+@input_error
+def find_fuzzy_contact(address_book: AddressBook) -> None:
+    """Function to find contacts with names like query, typos are allowed."""
+    query = get_input("Enter name, typos are allowed")
+    with metrics.phase("search"):
+        results = [record for record, _ in address_book.find_fuzzy(query)]
     print(show_search_results_table(results, query))
 
 
-def save_data(book, filename="addressbook.pkl"):
-    """Save address book to file."""
-    with open(filename, "wb") as f:
-        pickle.dump(book, f)
+@input_error
+def find_contact_by_phone(address_book: AddressBook) -> None:
+    """Function to find records by phone, its start or its end."""
+    query = get_input("Enter phone (050* searches by start, *4567 by end)")
+    with metrics.phase("search"):
+        results = search_by_phone(address_book, query)
+    print(show_search_results_table(results, query.strip("*")))
 
 
-def load_data(filename="addressbook.pkl"):
-    """Load address book from file."""
+def search_by_phone(book: AddressBook, query: str) -> list:
+    """Find records by phone, 050* finds by start and *4567 by end of number."""
+    if query.endswith("*"):
+        return book.find_by_phone_prefix(query.rstrip("*"))
+    if query.startswith("*"):
+        return book.find_by_phone_suffix(query.lstrip("*"))
+    return book.find_by_phone(query)
+
+
+@input_error
+def import_contacts_from_file(book: AddressBook) -> str:
+    """Import contacts from CSV or vCard file, invalid rows are reported by line."""
+    file_path = get_input("Enter file path to import contacts from (CSV/vCard)")
+    if not os.path.exists(file_path):
+        raise ValueError("File does not exist.")
+
+    def progress(imported, failed):
+        print(f"\r{trans('Imported contacts: {count}, bad rows: {failed}').format(count=imported, failed=failed)}",
+              end="", flush=True)
+
+    imported, errors, warnings = import_contacts(book, file_path, progress)
+    print()
+    for line_number, error in errors[:IMPORT_ERRORS_SHOWN]:
+        print(red_string(trans("Line {line}: {error}").format(line=line_number, error=trans(error, remember=False))))
+    if len(errors) > IMPORT_ERRORS_SHOWN:
+        print(red_string(trans("...and {count} more bad rows").format(count=len(errors) - IMPORT_ERRORS_SHOWN)))
+    for line_number, warning in warnings[:IMPORT_ERRORS_SHOWN]:
+        print(green_string(trans("Line {line}: {error}").format(line=line_number, error=trans(warning, remember=False))))
+    if len(warnings) > IMPORT_ERRORS_SHOWN:
+        print(green_string(trans("...and {count} more rows with duplicates").format(
+            count=len(warnings) - IMPORT_ERRORS_SHOWN)))
+    return trans("Imported contacts: {count}, bad rows: {failed}, with duplicates: {duplicates}").format(
+        count=imported, failed=len(errors), duplicates=len(warnings))
+
+
+def find_duplicates(book: AddressBook) -> str:
+    """Show phones and emails which several contacts have."""
+    with metrics.phase("search"):
+        duplicates = book.find_duplicates()
+    return show_duplicates_table(duplicates)
+
+
+def show_stats(book: AddressBook) -> str:
+    """Show latency percentiles of commands timed in this session."""
+    if not metrics.enabled:
+        return error_out("Metrics are off, start with --metrics or PIPBOY_METRICS=1")
+    return show_stats_table(metrics.summary())
+
+
+@metrics.timed("save")
+def save_data(book, filename=BOOK_FILE, encoded=None):
+    """Save address book to file, encoded is its copy from encode_book if it was taken earlier."""
+    if isinstance(book, SQLiteAddressBook):
+        # Changes are committed to database as they happen
+        book.close()
+        return
+    if book.journal and book.journal.snapshot_path == filename:
+        # Every change is already in journal, nothing to rewrite
+        book.close()
+        return
+    with file_lock(f"{filename}.lock"), atomic_write(filename, "wb") as f:
+        write_snapshot(f, book, encoded)
+
+
+def autosave_book(book, lock):
+    """Save book changed only in memory, journaled and SQLite books have every change on disk.
+
+    Records are encoded while commands wait, the file is written after they may run again.
+    """
+    if book.journal or isinstance(book, SQLiteAddressBook):
+        return
+    with lock:
+        generation, labels, records = encode_book(book)
+        encoded = generation, labels, list(records)
+    save_data(book, encoded=encoded)
+
+
+@metrics.timed("load")
+def load_data(filename=BOOK_FILE):
+    """Load address book from file and replay its change journal."""
+    if filename.endswith(SQLITE_EXTENSIONS):
+        return SQLiteAddressBook(filename)
     try:
-        with open(filename, "rb") as f:
-            data = pickle.load(f)
-            if isinstance(data, AddressBook):  # Check if loaded data is from AddressBook
-                return data
-            else:
-                print(f"""{error_out("Error reading saved data")}""")
-                return AddressBook()
-    except Exception: 
+        return Journal(filename).load()
+    except (ValueError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # Unreadable snapshot, start empty book which replaces it on exit
+        print(f"""{error_out("Error reading saved data")}""")
         return AddressBook()
@@ -0,0 +1,212 @@
+"""Local HTTP/JSON API over one in-memory address book and notes.
+
+Routes:
+  GET  /health                    - {"ok": true}
+  GET  /commands                  - names of commands
+  GET  /commands/<name>?arg=...   - run read-only command
+  POST /commands/<name>           - run any command, body is {"args": [...]}
+
+Commands and their arguments are the same as in batch mode. Answer is
+{"ok": true, "result": ...} or {"ok": false, "error": ...} with 4xx status.
+Read commands run side by side on worker threads, write commands run
+one at a time alone.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs, unquote, urlsplit
+from app.batch import COMMANDS, READ_COMMANDS, error_message, execute, to_json
+from app.classes.sqlite_address_book import SQLiteAddressBook
+
+logger = logging.getLogger(__name__)
+MAX_BODY_SIZE = 10 * 1024 * 1024
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class ReadWriteLock:
+    """asyncio lock letting in many readers or one writer, waiting writer stops new readers"""
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class HTTPError(Exception):
+    """Request can not be served, status is sent to client"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AssistantServer:
+    """Serves batch commands over HTTP for many concurrent clients"""
+
+    def __init__(self, book, notes, workers: int = None, save_lock=None):
+        self.book = book
+        self.notes = notes
+        # Passphrase prompt in worker would hang the request holding the write lock
+        self.notes.interactive = False
+        self.lock = ReadWriteLock()
+        # Held while data changes, autosave takes it to copy data
+        self.save_lock = save_lock or threading.RLock()
+        # SQLite book shares one connection, its queries run on one thread
+        self.executor = ThreadPoolExecutor(1 if isinstance(book, SQLiteAddressBook) else workers)
+
+    def _run(self, command: str, args: list) -> bytes:
+        try:
+            if command in READ_COMMANDS:
+                result = to_json(execute(self.book, self.notes, command, args))
+            else:
+                with self.save_lock:
+                    result = to_json(execute(self.book, self.notes, command, args))
+        except (ValueError, KeyError, OSError) as e:
+            raise HTTPError(400, error_message(e)) from e
+        except Exception as e:
+            # Bug in command must not kill the connection, client gets 500 and traceback goes to log
+            logger.exception("Command %r failed", command)
+            raise HTTPError(500, "Internal server error") from e
+        return json.dumps({"ok": True, "result": result}, ensure_ascii=False).encode()
+
+    async def run(self, command: str, args: list) -> bytes:
+        """Run command under shared lock for reads and exclusive lock for writes"""
+        loop = asyncio.get_running_loop()
+        if command in READ_COMMANDS and self.book.journal and self.book.journal.changed():
+            # Book file is shared with other processes, take their changes first
+            async with self.lock.write():
+                await loop.run_in_executor(self.executor, self.book.refresh)
+        lock = self.lock.read() if command in READ_COMMANDS else self.lock.write()
+        async with lock:
+            return await loop.run_in_executor(self.executor, self._run, command, args)
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> bytes:
+        """Return json answer for request, raise HTTPError for bad one"""
+        url = urlsplit(target)
+        path = url.path.rstrip("/")
+        if path == "/health":
+            return b'{"ok": true}'
+        if path == "/commands":
+            return json.dumps({"ok": True, "result": sorted(COMMANDS)}).encode()
+        if not path.startswith("/commands/"):
+            raise HTTPError(404, f"Unknown path '{url.path}'")
+
+        command = unquote(path[len("/commands/"):])
+        if command not in COMMANDS:
+            raise HTTPError(404, f"Invalid command '{command}'")
+        if method == "GET":
+            if command not in READ_COMMANDS:
+                raise HTTPError(405, f"Command '{command}' changes data, use POST")
+            args = parse_qs(url.query).get("arg", [])
+        elif method == "POST":
+            try:
+                args = json.loads(body or b"{}").get("args", [])
+            except (ValueError, AttributeError) as e:
+                raise HTTPError(400, "Body must be json object like {\"args\": [...]}") from e
+            if not isinstance(args, list):
+                raise HTTPError(400, "args must be a list")
+        else:
+            raise HTTPError(405, f"Method {method} is not allowed")
+        return await self.run(command, [str(arg) for arg in args])
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests of one connection, keep-alive is supported"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                keep_alive = True
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = await self._read_headers(reader)
+                    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                    size = int(headers.get("content-length", 0))
+                    if size > MAX_BODY_SIZE:
+                        keep_alive = False
+                        raise HTTPError(413, "Request body is too large")
+                    body = await reader.readexactly(size) if size else b""
+                    status, answer = 200, await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, answer = e.status, json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False).encode()
+                except ValueError:
+                    status, answer = 400, b'{"ok": false, "error": "Malformed request"}'
+                    keep_alive = False
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(answer)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + answer
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> dict:
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None) -> None:
+        """Serve until SIGINT or SIGTERM"""
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        address = socket_path or "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+        print(f"Serving on {address}", flush=True)
+        async with server:
+            await stop.wait()
+        self.executor.shutdown()
+        if socket_path:
+            os.remove(socket_path)
@@ -1,11 +1,24 @@
-from tabulate import tabulate
+import calendar
 from colorama import Fore, Style, init
 from app.classes.address_book import AddressBook
+from app.classes.autosave import waiting_for_input
 from app.classes.record import Record
 from app.classes.localization import trans
+from app.classes.metrics import metrics
 
 init(autoreset=True)
 
+# Contacts shown on one screen by 'all' command
+PAGE_SIZE = 20
+
+
+@metrics.timed("render")
+def tabulate(*args, **kwargs) -> str:
+    """tabulate.tabulate imported on first table render"""
+    from tabulate import tabulate as _tabulate
+
+    return _tabulate(*args, **kwargs)
+
 def show_menu_notes():
     """show help notes data function"""
     menu_data = [
@@ -16,8 +29,11 @@ def show_menu_notes():
         ['note-search', trans('Search note')],
         ['note-add-tag', trans('Add tag to note')],
         ['note-search-by-tag', trans('Search note by tag')],
+        ['notes-tags', trans('Show tags with number of notes')],
         ['note-encrypt', trans('Encrypt note')],
         ['note-decrypt', trans('Decrypt note')],
+        ['notes-encrypt-all', trans('Encrypt all notes or notes by tag query')],
+        ['notes-decrypt-all', trans('Decrypt all notes or notes by tag query')],
         ['notes-import', trans('Import notes from file')],
         ['notes-export', trans('Export notes to file')],
         ['note-save', trans('Save note')],
@@ -38,9 +54,15 @@ def show_menu():
         ['add', trans('Add new record')],
         ['edit', trans('Change phone number')],
         ['birthdays', trans('Show upcoming birthdays')],
+        ['birthday-stats', trans('Show birthdays per month and weekday, ages and round birthdays')],
         ['remove-contact', trans('Remove contact with name')],
         ['show-contact', trans('Show contact by name')],
         ['find', trans('Find contacts containing search query')],
+        ['find-phone', trans('Find contacts by phone, * marks start or end of number')],
+        ['find-fuzzy', trans('Find contacts by name allowing typos')],
+        ['import-contacts', trans('Import contacts from CSV or vCard file')],
+        ['dedupe', trans('Find phones and emails which several contacts have')],
+        ['stats', trans('Show command latency percentiles')],
         ['close or exit', trans('Exit from program')]
     ]
     menu_data = [[green_string(item) for item in row] for row in menu_data]
@@ -56,17 +78,26 @@ def blue_string(text: str) -> str:
     """return string in green color"""
     return f"{Fore.BLUE}{trans(text)}{Style.RESET_ALL}"
 
-def error_out(error: str) -> str:
-    """return red string, used to output errors"""
-    return f"{Fore.RED}{trans(str(error))}{Style.RESET_ALL}"
+def error_out(error) -> str:
+    """return red string, used to output errors, exception messages are not remembered as missing keys"""
+    return red_string(trans(str(error), remember=not isinstance(error, Exception)))
+
 
+def red_string(text: str) -> str:
+    """return already translated string in red color"""
+    return f"{Fore.RED}{text}{Style.RESET_ALL}"
+
+@metrics.timed("input")
 def green_input(prompt: str) -> str:
     """Colorized input to green color"""
-    return input(f"{Fore.GREEN}{trans(prompt)+':'}{Style.RESET_ALL}")
+    with waiting_for_input():
+        return input(f"{Fore.GREEN}{trans(prompt)+':'}{Style.RESET_ALL}")
 
+@metrics.timed("input")
 def blue_input(prompt: str) -> str:
     """Colorized input to blue color"""
-    return input(f"{Fore.BLUE}{trans(prompt)+':'}{Style.RESET_ALL}")
+    with waiting_for_input():
+        return input(f"{Fore.BLUE}{trans(prompt)+':'}{Style.RESET_ALL}")
 
 def format_record_for_display(record, query=None) -> dict:
     """Formating record into table and colorize search query in yellow if serach query presents"""
@@ -76,7 +107,7 @@ def format_record_for_display(record, query=None) -> dict:
         return f"{Fore.YELLOW}{text}{Style.RESET_ALL}"
 
     name = record.name.value
-    phones = "\n".join(phone.value for phone in record.phones)
+    phones = "\n".join(record.phone_numbers)
     email = record.email.value if record.email else "Немає"
     addresses = "\n".join(f"{address.label}: {address.address}" for address in record.addresses.values())
     birthday = record.birthday.value.strftime('%d.%m.%Y') if record.birthday else "Немає"
@@ -100,14 +131,20 @@ def format_record_for_display(record, query=None) -> dict:
 
 
 def show_all_contacts(book: AddressBook) -> str:
-    """show all records in address book as table """
+    """show all records in address book as table, page by page"""
     if not book.data:
         return f"{green_string(trans('Address book is empty'))}"
-    
-    table = [format_record_for_display(record) for record in book.data.values()]
-    table_str = tabulate(table, headers="keys", tablefmt="grid", stralign="center")
-    
-    return f"{green_string(table_str)}"
+
+    cursor = None
+    while True:
+        page, cursor = book.get_page(cursor, PAGE_SIZE)
+        table = [format_record_for_display(record) for record in page]
+        print(green_string(tabulate(table, headers="keys", tablefmt="grid", stralign="center")))
+        if cursor is None:
+            break
+        if green_input("Press Enter for next page or 'q' to stop").strip().lower() == "q":
+            break
+    return None
 
 
 def show_contact_table(record: Record) -> str:
@@ -142,6 +179,73 @@ def show_all_notes_table(notes_manager):
     return f"{green_string(table_str)}"
 
 
+def show_notes_search_table(results):
+    """Show ranked notes search results as table"""
+    table = [
+        {trans("Header"): title, trans("Score"): f"{score:.2f}", trans("Text"): snippet}
+        for title, score, snippet in results
+    ]
+    table_str = tabulate(table, headers="keys", tablefmt="grid", stralign="center")
+    return f"{green_string(table_str)}"
+
+
+def show_tag_counts_table(counts: dict):
+    """Show number of notes for every tag as table"""
+    table = [{trans("Tag"): tag, trans("Notes"): count} for tag, count in counts.items()]
+    table_str = tabulate(table, headers="keys", tablefmt="grid", stralign="center")
+    return f"{green_string(table_str)}"
+
+
+def show_stats_table(rows: list):
+    """Show latency percentiles of commands and phases in milliseconds"""
+    if not rows:
+        return f"{green_string(trans('No commands timed yet'))}"
+    table = [
+        {
+            trans("Command"): row["command"], trans("Phase"): row["phase"], trans("Calls"): row["calls"],
+            "p50, ms": f"{row['p50'] * 1000:.2f}", "p95, ms": f"{row['p95'] * 1000:.2f}",
+            "p99, ms": f"{row['p99'] * 1000:.2f}", "max, ms": f"{row['max'] * 1000:.2f}",
+            trans("Errors"): row["errors"],
+        }
+        for row in rows
+    ]
+    table_str = tabulate(table, headers="keys", tablefmt="grid", stralign="center")
+    return f"{green_string(table_str)}"
+
+
+def show_birthday_stats_table(report: dict):
+    """Show birthdays per month and weekday, ages and round birthdays of this quarter"""
+    if not report["total"]:
+        return f"{green_string(trans('No birthdays in address book'))}"
+    contacts = trans("Contacts")
+    tables = [
+        [{trans("Month"): calendar.month_name[month], contacts: count} for month, count in report["by_month"].items()],
+        [{trans("Weekday"): calendar.day_name[day], contacts: count} for day, count in report["by_weekday"].items()],
+        [{trans("Age"): ages, contacts: count} for ages, count in report["ages"].items()],
+    ]
+    if report["round"]:
+        tables.append([
+            {trans("Name"): item["name"], trans("Birthday"): item["date"].strftime("%d.%m.%Y"), trans("Age"): item["age"]}
+            for item in report["round"]
+        ])
+    parts = [tabulate(table, headers="keys", tablefmt="grid", stralign="center") for table in tables]
+    if not report["round"]:
+        parts.append(trans("No round birthdays this quarter"))
+    return green_string("\n".join(parts))
+
+
+def show_duplicates_table(duplicates: list):
+    """Show phones and emails shared by several contacts"""
+    if not duplicates:
+        return f"{green_string(trans('No duplicated phones or emails'))}"
+    table = [
+        {trans("Field"): trans(field), trans("Value"): value, trans("Contacts"): "\n".join(names)}
+        for field, value, names in duplicates
+    ]
+    table_str = tabulate(table, headers="keys", tablefmt="grid", stralign="center")
+    return f"{green_string(table_str)}"
+
+
 def show_search_results_table(results, query=None):
     """Show records after search"""
     if not results:
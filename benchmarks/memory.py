@@ -0,0 +1,121 @@
+"""Memory benchmark: per-contact resident and pickle size of AddressBook.
+
+Usage: python -m benchmarks.memory [contacts] [--layout current|legacy] [--output memory.json]
+
+`--layout legacy` builds the same book from records laid out like before
+slotted fields and packed phones: every field an object with __dict__ and
+phones a list of such objects. `--output` writes results in the format of
+benchmarks.suite, so two layouts are compared with
+
+  python -m benchmarks.memory --layout legacy --output before.json
+  python -m benchmarks.memory --output after.json
+  python -m benchmarks.suite compare before.json after.json
+"""
+
+import argparse
+import json
+import pickle
+import platform
+import random
+import tracemalloc
+from datetime import datetime
+from app.classes.address_book import AddressBook
+from app.classes.record import Record
+
+LABELS = ["Home", "Work", "Office", "Vault"]
+LAYOUTS = ("current", "legacy")
+
+
+class LegacyField:
+    """Field as it was before __slots__, value kept in instance __dict__"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class LegacyAddress:
+    def __init__(self, label: str, address: str):
+        self.label = label
+        self.address = address
+
+
+class LegacyRecord:
+    """Record as it was before packed phones, every phone is a field object in a list"""
+
+    def __init__(self, name: str):
+        self.name = LegacyField(name)
+        self.phones = []
+        self.birthday = None
+        self.email = None
+        self.addresses = {}
+
+    def add_phone(self, phone: str) -> None:
+        self.phones.append(LegacyField(phone))
+
+    def add_email(self, email: str) -> None:
+        self.email = LegacyField(email)
+
+    def add_birthday(self, birthday: str) -> None:
+        self.birthday = LegacyField(datetime.strptime(birthday, "%d.%m.%Y").date())
+
+    def add_address(self, label: str, address: str) -> None:
+        self.addresses[label] = LegacyAddress(label, address)
+
+
+def build_book(size: int, layout: str = "current") -> AddressBook:
+    """Build book of size contacts with 2 phones, email, birthday and address"""
+    rnd = random.Random(42)
+    book = AddressBook()
+    for i in range(size):
+        record = (LegacyRecord if layout == "legacy" else Record)(f"Contact {i}")
+        record.add_phone(f"{rnd.randrange(10**10):010d}")
+        record.add_phone(f"{rnd.randrange(10**10):010d}")
+        record.add_email(f"contact{i}@example.com")
+        record.add_birthday(f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(1950, 2005)}")
+        record.add_address(rnd.choice(LABELS), f"Street {i}, Kyiv")
+        if layout == "legacy":
+            book.data[record.name.value] = record
+        else:
+            book.add_record(record)
+    return book
+
+
+def measure(size: int, layout: str = "current") -> dict:
+    """Bytes per contact in memory and in pickle"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    book = build_book(size, layout)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {"memory": (after - before) / size, "pickle": len(pickle.dumps(book)) / size}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.memory")
+    parser.add_argument("contacts", nargs="?", type=int, default=100_000)
+    parser.add_argument("--layout", choices=LAYOUTS, default="current", help="record layout to measure")
+    parser.add_argument("--output", help="json file for benchmarks.suite compare")
+    args = parser.parse_args(argv)
+
+    result = measure(args.contacts, args.layout)
+    print(f"contacts:          {args.contacts} ({args.layout} layout)")
+    print(f"memory per contact: {result['memory']:.1f} bytes")
+    print(f"pickle per contact: {result['pickle']:.1f} bytes")
+    if args.output:
+        meta = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "layout": args.layout,
+        }
+        results = [
+            {"name": f"{kind} per contact", "size": args.contacts, "median": value, "min": value, "unit": "bytes"}
+            for kind, value in result.items()
+        ]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
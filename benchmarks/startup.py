@@ -0,0 +1,77 @@
+"""Startup benchmark: import time breakdown and time to first prompt.
+
+Usage: python -m benchmarks.startup [runs]
+
+Runs the assistant in a temporary data directory with PIPBOY_LANG=en, so the
+numbers do not depend on the data in the working directory.
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = b"Enter a command"
+
+
+def _env() -> dict:
+    env = dict(os.environ, PIPBOY_LANG="en", PYTHONPATH=ROOT)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def import_times(top: int = 15) -> list:
+    """Return top (cumulative microseconds, module) pairs of `python -X importtime -c 'import main'`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=_env(), capture_output=True, check=True,
+    )
+    times = []
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times.append((int(cumulative), module.rstrip()))
+    return sorted(times, reverse=True)[:top]
+
+
+def time_to_prompt(data_dir: str) -> float:
+    """Seconds from process start until the first command prompt is printed"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "main.py"), "--interactive"],
+        cwd=data_dir, env=_env(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    output = b""
+    while PROMPT not in output:
+        chunk = process.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError("Assistant exited before showing the prompt")
+        output += chunk
+    elapsed = time.perf_counter() - start
+    process.communicate(b"exit\n")
+    return elapsed
+
+
+def main(runs: int = 10) -> None:
+    print("Import time, cumulative:")
+    for cumulative, module in import_times():
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        time_to_prompt(data_dir)  # warm up bytecode and locale caches
+        samples = [time_to_prompt(data_dir) for _ in range(runs)]
+    finally:
+        shutil.rmtree(data_dir)
+    print(f"Time to first prompt over {runs} runs:")
+    print(f"  median {statistics.median(samples) * 1000:.1f} ms, "
+          f"min {min(samples) * 1000:.1f} ms, max {max(samples) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
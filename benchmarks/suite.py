@@ -0,0 +1,217 @@
+"""Benchmark suite of address book and notes operations on synthetic data.
+
+Usage:
+  python -m benchmarks.suite run [--sizes 1000,10000,100000] [--runs 5] [--output results.json]
+  python -m benchmarks.suite compare baseline.json results.json [--threshold 0.2]
+
+`run` times every operation on books and note stores of every size and writes
+median and min seconds per call to json. `compare` prints changes between two
+result files and exits with 1 if any operation got slower than threshold.
+Results with "unit": "bytes", written by benchmarks.memory, are compared the
+same way, growth over threshold is a regression.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Translated output must not wait for language prompt
+os.environ.setdefault("PIPBOY_LANG", "en")
+
+from app import visualiser  # noqa: E402
+from app.classes.address_book import AddressBook  # noqa: E402
+from app.classes.contacts_import import import_contacts  # noqa: E402
+from app.classes.notes_io import write_notes  # noqa: E402
+from app.functions import load_data, save_data  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+
+DEFAULT_SIZES = (1000, 10_000, 100_000)
+QUERIES = 20
+# Changes of faster operations are timer noise
+NOISE_FLOOR = 50e-6
+
+
+def measure(operation, runs: int, calls: int = 1) -> dict:
+    """Time operation runs times, operation does calls calls per run"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        operation()
+        samples.append((time.perf_counter() - start) / calls)
+    return {"median": statistics.median(samples), "min": min(samples), "runs": runs}
+
+
+def _queries(book: AddressBook, notes, rnd: random.Random) -> dict:
+    """Query terms taken from generated data, so searches find something"""
+    records = rnd.sample(list(book.data.values()), min(QUERIES, len(book.data)))
+    titles = rnd.sample(list(notes.notes), min(QUERIES, len(notes.notes)))
+    return {
+        "names": [record.name.value for record in records],
+        # Name parts, phone fragments and cities
+        "search": [
+            rnd.choice((record.name.value.split()[1], record.phones[0].value[3:8], rnd.choice(synthetic.CITIES)))
+            for record in records
+        ],
+        "keywords": [" ".join(rnd.sample(synthetic.WORDS, rnd.choice((1, 2)))) for _ in titles],
+        "tags": [
+            rnd.choice(synthetic.TAGS) if i % 2 else f"{rnd.choice(synthetic.TAGS)} AND {rnd.choice(synthetic.TAGS)}"
+            for i in range(len(titles))
+        ],
+    }
+
+
+def _first_page(book: AddressBook) -> None:
+    """show_all_contacts stopped after the first page, output is dropped"""
+    prompt = visualiser.green_input
+    visualiser.green_input = lambda text: "q"
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            visualiser.show_all_contacts(book)
+    finally:
+        visualiser.green_input = prompt
+
+
+def bench_size(size: int, runs: int, workdir: str) -> list:
+    """Return results of all operations on data of size entries"""
+    print(f"Generating {size} contacts and notes...", flush=True)
+    book = synthetic.make_book(size)
+    notes = synthetic.make_notes(size)
+    queries = _queries(book, notes, random.Random(size))
+    # Persistence and import/export of big data are repeated less
+    heavy_runs = max(1, min(runs, runs * 10_000 // size))
+    paths = {name: os.path.join(workdir, name) for name in ("book.pkl", "contacts.csv", "notes.json", "notes.csv")}
+    synthetic.write_contacts_csv(paths["contacts.csv"], size)
+
+    def cold_search():
+        book._indexes.pop("search", None)
+        book.find_by_query(queries["search"][0])
+
+    def cold_birthdays():
+        book._indexes.pop("birthday", None)
+        book.show_upcoming_birthdays(7)
+
+    def import_book():
+        import_contacts(AddressBook(), paths["contacts.csv"])
+
+    def load_book():
+        loaded = load_data(paths["book.pkl"])
+        loaded.close()
+
+    def load_notes():
+        synthetic.make_notes(0).load_notes_file(paths["notes.json"])
+
+    cases = [
+        ("find_by_query (index build)", cold_search, runs, 1),
+        ("find_by_query", lambda: [book.find_by_query(q) for q in queries["search"]], runs, QUERIES),
+        ("find", lambda: [book.find(name) for name in queries["names"]], runs, QUERIES),
+        ("show_upcoming_birthdays (index build)", cold_birthdays, runs, 1),
+        ("show_upcoming_birthdays", lambda: book.show_upcoming_birthdays(7), runs, 1),
+        ("birthday_stats", book.birthday_stats, runs, 1),
+        ("show_all_contacts (first page)", lambda: _first_page(book), runs, 1),
+        ("get_page (all pages)", lambda: sum(1 for _ in book.iter_pages()), heavy_runs, 1),
+        ("save_data", lambda: save_data(book, paths["book.pkl"]), heavy_runs, 1),
+        ("load_data", load_book, heavy_runs, 1),
+        ("import contacts csv", import_book, heavy_runs, 1),
+        ("search_notes_by_keyword", lambda: [notes.search_notes_by_keyword(k) for k in queries["keywords"]],
+         runs, QUERIES),
+        ("search_notes_by_tag", lambda: [notes.search_notes_by_tag(t) for t in queries["tags"]], runs, QUERIES),
+        ("export notes json", lambda: write_notes(paths["notes.json"], notes.notes.items()), heavy_runs, 1),
+        ("export notes csv", lambda: write_notes(paths["notes.csv"], notes.notes.items()), heavy_runs, 1),
+        ("import notes json", load_notes, heavy_runs, 1),
+        ("import notes csv", lambda: synthetic.make_notes(0).import_from_file(paths["notes.csv"]), heavy_runs, 1),
+    ]
+    results = []
+    for name, operation, case_runs, calls in cases:
+        result = {"name": name, "size": size, **measure(operation, case_runs, calls)}
+        print(f"  {name:<40} {_format_time(result['median'])}", flush=True)
+        results.append(result)
+    return results
+
+
+def _format_value(value: float, unit: str = "seconds") -> str:
+    return f"{value:9.1f} B " if unit == "bytes" else _format_time(value)
+
+
+def _format_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:9.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:9.1f} ms"
+    return f"{seconds:9.2f} s "
+
+
+def run(sizes, runs: int, output: str) -> None:
+    workdir = tempfile.mkdtemp()
+    try:
+        results = [result for size in sizes for result in bench_size(size, runs, workdir)]
+    finally:
+        shutil.rmtree(workdir)
+    meta = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sizes": list(sizes),
+        "runs": runs,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+def compare(baseline: str, current: str, threshold: float) -> int:
+    """Print changes of median times or sizes, return number of regressions"""
+    with open(baseline, "r", encoding="utf-8") as f:
+        old = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    with open(current, "r", encoding="utf-8") as f:
+        new = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for key in sorted(old.keys() & new.keys(), key=lambda key: (key[1], key[0])):
+        before, after = old[key]["median"], new[key]["median"]
+        unit = new[key].get("unit", "seconds")
+        change = after / before - 1 if before else 0.0
+        mark = ""
+        if abs(after - before) >= (NOISE_FLOOR if unit == "seconds" else 0) and abs(change) > threshold:
+            mark = "REGRESSION" if change > 0 else ("faster" if unit == "seconds" else "smaller")
+            regressions += change > 0
+        print(f"{key[0]:<40} {key[1]:>8} {_format_value(before, unit)} -> {_format_value(after, unit)} "
+              f"{change:+8.1%} {mark}")
+    for name, size in sorted(old.keys() ^ new.keys()):
+        print(f"{name:<40} {size:>8} only in {'baseline' if (name, size) in old else 'results'}")
+    print(f"{regressions} regression(s) over {threshold:.0%}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run benchmarks and save results")
+    run_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                            help="comma separated numbers of contacts and notes, up to 1000000")
+    run_parser.add_argument("--runs", type=int, default=5, help="runs of every operation")
+    run_parser.add_argument("--output", default="benchmark_results.json", help="json file for results")
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run([int(size) for size in args.sizes.split(",")], args.runs, args.output)
+        return 0
+    return 1 if compare(args.baseline, args.results, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Generators of realistic synthetic address books and note stores.
+
+All generators are seeded, the same size and seed give the same data.
+"""
+
+import csv
+import random
+from app.classes.address_book import AddressBook
+from app.classes.record import Record
+
+FIRST_NAMES = [
+    "Amata", "Butch", "James", "Moira", "Sarah", "Harkness", "Cait", "Preston", "Piper", "Nick",
+    "Deacon", "Curie", "Danse", "Hancock", "Kellogg", "Arcade", "Veronica", "Boone", "Lily", "Raul",
+    "Олена", "Тарас", "Ірина", "Богдан", "Оксана", "Андрій", "Марія", "Дмитро", "Софія", "Іван",
+]
+LAST_NAMES = [
+    "Almodovar", "DeLoria", "Burke", "Brown", "Lyons", "Garvey", "Wright", "Valentine", "Maxson", "Gannon",
+    "Шевченко", "Коваленко", "Бондаренко", "Ткаченко", "Кравченко", "Олійник", "Мельник", "Поліщук",
+]
+OPERATORS = ["050", "066", "067", "068", "073", "093", "095", "096", "097", "098", "099"]
+CITIES = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Megaton", "Diamond City", "New Vegas", "Rivet City"]
+STREETS = ["Main st", "Shevchenka", "Khreshchatyk", "Vault road", "Wasteland ave", "Franka", "Sadova"]
+LABELS = ["home", "work", "office", "vault"]
+DOMAINS = ["example.com", "vault-tec.com", "ukr.net", "gmail.com"]
+
+WORDS = (
+    "vault water radio caps stimpak rad away power armor brotherhood steel enclave raider super mutant "
+    "ghoul deathclaw mole rat radroach brahmin nuka cola quantum pip boy terminal holotape bobblehead "
+    "settlement workshop purifier generator turret scavenge junk adhesive copper steel circuitry "
+    "mission quest trade merchant caravan doctor repair weapon ammo laser plasma rifle pistol "
+    "сховище вода радіо кришки стімпак броня братство сталі анклав рейдер мутант гуль "
+    "поселення майстерня генератор торгівля караван лікар ремонт зброя набої гвинтівка"
+).split()
+TAGS = [
+    "work", "urgent", "done", "home", "trade", "quest", "vault", "repair", "food", "water",
+    "settlement", "caravan", "idea", "todo", "important",
+]
+# Zipf-like word frequency, few words are very common like in real text
+WORD_WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+
+def contact_rows(size: int, seed: int = 42):
+    """Yield contact rows like the ones read from import CSV"""
+    rnd = random.Random(seed)
+    for i in range(size):
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        row = {
+            "name": f"{first} {last} {i}",
+            "phones": [f"{rnd.choice(OPERATORS)}{rnd.randrange(10 ** 7):07d}" for _ in range(rnd.choice((1, 1, 2, 3)))],
+            "email": f"{first.lower()}.{i}@{rnd.choice(DOMAINS)}" if first.isascii() and rnd.random() < 0.8 else None,
+            "birthday": None,
+            "addresses": {},
+        }
+        if rnd.random() < 0.9:
+            year = rnd.randint(1950, 2008)
+            # Some of contacts are born on 29 February
+            if year % 4 == 0 and rnd.random() < 0.02:
+                row["birthday"] = f"29.02.{year}"
+            else:
+                row["birthday"] = f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{year}"
+        for label in rnd.sample(LABELS, rnd.choice((0, 1, 1, 2))):
+            row["addresses"][label] = f"{rnd.choice(STREETS)} {rnd.randint(1, 200)}, {rnd.choice(CITIES)}"
+        yield row
+
+
+def make_book(size: int, seed: int = 42) -> AddressBook:
+    """Address book of size synthetic contacts"""
+    book = AddressBook()
+    book.add_records([Record.from_dict(row) for row in contact_rows(size, seed)])
+    return book
+
+
+def write_contacts_csv(file_path: str, size: int, seed: int = 42) -> None:
+    """Write synthetic contacts to CSV file in import-contacts format"""
+    with open(file_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "phones", "email", "birthday", "addresses"])
+        for row in contact_rows(size, seed):
+            writer.writerow([
+                row["name"],
+                ";".join(row["phones"]),
+                row["email"] or "",
+                row["birthday"] or "",
+                ";".join(f"{label}: {address}" for label, address in row["addresses"].items()),
+            ])
+
+
+def note_items(size: int, seed: int = 42):
+    """Yield (title, note) pairs of synthetic notes"""
+    rnd = random.Random(seed)
+    for i in range(size):
+        words = rnd.choices(WORDS, WORD_WEIGHTS, k=rnd.randint(20, 80))
+        title = f"{' '.join(rnd.sample(WORDS, 2))} {i}"
+        yield title, {"content": " ".join(words), "tags": rnd.sample(TAGS, rnd.randint(0, 3))}
+
+
+def make_notes(size: int, seed: int = 42):
+    """NotesManager with size synthetic notes"""
+    from app.function_notes import NotesManager
+
+    notes = NotesManager()
+    notes.notes.update(note_items(size, seed))
+    return notes
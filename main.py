@@ -1,20 +1,29 @@
 """Main module for address book"""
 
+import argparse
+import atexit
+import os
 import readline
+import sys
+import time
 from app.functions import (
-    add_contact, edit_contact, upcoming_birthdays, remove_contact,
-    show_contact, save_data, load_data, find_contact
+    add_contact, edit_contact, upcoming_birthdays, birthday_stats, remove_contact,
+    show_contact, save_data, load_data, find_contact, find_contact_by_phone, find_fuzzy_contact,
+    import_contacts_from_file, show_stats, autosave_book, find_duplicates
 )
 from app.visualiser import (
     show_menu, show_all_contacts, green_input, show_all_notes_table,
     show_menu_notes
 )
 from app.function_notes import NotesManager
-from app.classes.localization import trans
+from app.classes.address_book import DUPLICATES_ENV, DUPLICATE_POLICIES
+from app.classes.autosave import AUTOSAVE_DELAY, AutoSaver
+from app.classes.completion import Completer, PrefixSet
+from app.classes.localization import LANGUAGE_ENV, trans
+from app.classes.metrics import METRICS_ENV, metrics
 
-# init main classes
+# init main classes, data is loaded in main()
 notes_manager = NotesManager()
-book = load_data()
 
 
 def parse_input(user_input: str) -> tuple[str, list[str]]:
@@ -31,13 +40,19 @@ commands_book = {
     "edit": edit_contact,
     "all": show_all_contacts,
     "birthdays": upcoming_birthdays,
+    "birthday-stats": birthday_stats,
     "close": lambda book: "Good bye!",
     "exit": lambda book: "Good bye!",
     "help": lambda book: show_menu(),
     "menu": lambda book: show_menu(),
     "remove-contact": remove_contact,
     "show-contact": show_contact,
-    "find": find_contact
+    "find": find_contact,
+    "find-phone": find_contact_by_phone,
+    "find-fuzzy": find_fuzzy_contact,
+    "import-contacts": import_contacts_from_file,
+    "dedupe": find_duplicates,
+    "stats": show_stats,
 }
 
 commands_note = {
@@ -50,8 +65,11 @@ commands_note = {
     "note-search": lambda: notes_manager.search_notes_by_keyword(),
     "note-add-tag": lambda: notes_manager.add_tag(),
     "note-search-by-tag": lambda: notes_manager.search_notes_by_tag(),
+    "notes-tags": lambda: notes_manager.tag_counts(),
     "note-encrypt": lambda: notes_manager.encrypt_note(),
     "note-decrypt": lambda: notes_manager.decrypt_note(),
+    "notes-encrypt-all": lambda: notes_manager.encrypt_all(),
+    "notes-decrypt-all": lambda: notes_manager.decrypt_all(),
     "notes-import": lambda: notes_manager.import_notes(),
     "notes-export": lambda: notes_manager.export_notes(),
     "note-save": lambda: notes_manager.save_notes(),
@@ -70,81 +88,172 @@ record_edit_commands = {
 record_edit_commands["done"] = None
 record_edit_commands["show"] = None
 
-current_commands = commands_book | commands_note
+# Commands which first ask for contact name or note title, Tab completes them
+NAME_COMMANDS = ("edit", "show-contact", "remove-contact")
+TITLE_COMMANDS = (
+    "note-show", "note-edit", "note-delete", "note-add-tag", "note-encrypt", "note-decrypt"
+)
+
+main_commands = PrefixSet(commands_book | commands_note)
+edit_commands = PrefixSet(record_edit_commands)
+completer = Completer(main_commands.complete)
 
 
 def enter_edit_mode():
     """Switch autocompleter to edit user commands."""
-    global current_commands
-    current_commands = record_edit_commands
-    init_completer()
+    completer.source = edit_commands.complete
 
 
 def exit_edit_mode():
     """Switch autocompleter to main commands."""
-    global current_commands
-    current_commands = commands_book | commands_note
-    init_completer()
-
-
-def completer(text, state):
-    """Completer function. Use tab for available commands."""
-    options = [
-        cmd for cmd in current_commands.keys() if cmd.startswith(text)
-    ]
-    return options[state] if state < len(options) else None
+    completer.source = main_commands.complete
 
 
 # Initialize readline for tab completion
 def init_completer():
     """autocompliter setup"""
     readline.parse_and_bind("tab: complete")
+    # Whole input is completed, names have spaces and commands have dashes
+    readline.set_completer_delims("")
     readline.set_completer(completer)
 
 
 init_completer()
 
 
-def main():
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(prog="pipboy-assistant")
+    parser.add_argument("--script", help="run commands from file without prompts, - for stdin")
+    parser.add_argument("--interactive", action="store_true", help="show prompts even when stdin is not a terminal")
+    parser.add_argument("--tables", action="store_true", help="render batch results as tables instead of json lines")
+    parser.add_argument("--serve", action="store_true", help="serve commands over local HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve on")
+    parser.add_argument("--port", type=int, default=8765, help="port to serve on")
+    parser.add_argument("--socket", help="serve on unix socket instead of port")
+    parser.add_argument("--autosave", type=float, default=AUTOSAVE_DELAY, metavar="SECONDS",
+                        help="save changed data after this many seconds without changes, 0 turns it off")
+    parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES,
+                        help="what to do with phone or email other contact has, warn by default")
+    parser.add_argument("--metrics", action="store_true", help="time commands and their phases, see 'stats'")
+    parser.add_argument("--metrics-file", help="save collected metrics to json file on exit, implies --metrics")
+    return parser.parse_args(argv)
+
+
+def run_batch(script, tables=False):
+    """Run commands from script, data is saved once after the last command."""
+    from app.batch import run_script
+
+    # Batch output must not wait for language prompt
+    os.environ.setdefault(LANGUAGE_ENV, "en")
+    notes_manager.interactive = False
+    notes_manager.load_notes_file('notes.json')
+    book = load_data()
+    if script in (None, "-"):
+        failed = run_script(sys.stdin, book, notes_manager, tables)
+    else:
+        with open(script, "r", encoding="utf-8") as f:
+            failed = run_script(f, book, notes_manager, tables)
+    save_data(book)
+    notes_manager.save_notes_file('notes.json')
+    return 1 if failed else 0
+
+
+def start_autosave(book, delay):
+    """Create autosaver of book and notes, its thread runs only if delay is positive."""
+    saver = AutoSaver(delay)
+    saver.add("book", lambda: book.changes, lambda lock: autosave_book(book, lock))
+    saver.add("notes", lambda: notes_manager.changes, lambda lock: notes_manager.autosave('notes.json', lock))
+    if delay > 0:
+        saver.start()
+    return saver
+
+
+def run_server(host, port, socket_path=None, autosave=AUTOSAVE_DELAY):
+    """Serve commands over HTTP until stopped, data is saved on stop."""
+    import asyncio
+    from app.server import AssistantServer
+
+    os.environ.setdefault(LANGUAGE_ENV, "en")
+    notes_manager.interactive = False
+    notes_manager.load_notes_file('notes.json')
+    book = load_data()
+    saver = start_autosave(book, autosave)
+    try:
+        asyncio.run(AssistantServer(book, notes_manager, save_lock=saver.lock).serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        saver.stop()
+        save_data(book)
+        notes_manager.save_notes_file('notes.json')
+
+
+def dispatch(command, book):
+    """Run command handler and print its result."""
+    if command in NAME_COMMANDS:
+        completer.source = book.complete_names
+    elif command in TITLE_COMMANDS:
+        completer.source = notes_manager.complete_titles
+
+    if command == "add":
+        result = add_contact(book)
+    elif command == "edit":
+        result = edit_contact(book, exit_edit_mode, enter_edit_mode)
+    elif command in commands_book:
+        result = commands_book[command](book)
+    elif command in commands_note:
+        result = commands_note[command]()
+    else:
+        result = trans("Invalid command.")
+    if result:
+        print(result)
+
+
+def main(argv=None):
     """Main function to handle user input and commands."""
-    notes_manager.import_notes('notes.json')  # load notes
-    book = load_data()  # load address book data
+    args = parse_args(argv)
+    if args.metrics or args.metrics_file or os.environ.get(METRICS_ENV):
+        metrics.enable()
+    if args.metrics_file:
+        atexit.register(metrics.dump, args.metrics_file)
+    if args.duplicates:
+        os.environ[DUPLICATES_ENV] = args.duplicates
+    if args.serve:
+        return run_server(args.host, args.port, args.socket, args.autosave)
+    if args.script or not (args.interactive or sys.stdin.isatty()):
+        sys.exit(run_batch(args.script, args.tables))
+
+    with metrics.command("startup"):
+        notes_manager.load_notes_file('notes.json')  # load notes
+        book = load_data()  # load address book data
+    saver = start_autosave(book, args.autosave)
     
     print(trans("Welcome to the assistant bot!"))
     show_menu()
 
     while True:
+        start = time.perf_counter()
         user_input = green_input("Enter a command")
         command = parse_input(user_input)
+        name = command if command in main_commands else "invalid"
+        metrics.record(name, "prompt", time.perf_counter() - start)
 
         if command in ["close", "exit"]:
             print(trans("Good bye!"))
             break
 
-        if command == "add":
-            result = add_contact(book)
-            if result:
-                print(result)
-        elif command == "edit":
-            enter_edit_mode()
-            result = edit_contact(book, exit_edit_mode)
-            if result:
-                print(result)
-        elif command in commands_book:
-            result = commands_book[command](book)
-            if result:
-                print(result)
-        elif command in commands_note:
-            result = commands_note[command]()
-            if result:
-                print(result)
-        else:
-            print(trans("Invalid command."))
+        # Prompts of the command release the lock, autosave waits only while data changes
+        with metrics.command(name), saver.lock:
+            book.refresh()  # changes saved by other running assistants
+            dispatch(command, book)
+        exit_edit_mode()
 
     # Save our data
-    save_data(book)
-    notes_manager.export_notes('notes.json')
-
+    saver.stop()
+    with metrics.command("shutdown"):
+        save_data(book)
+        notes_manager.save_notes_file('notes.json')
 
 
 if __name__ == '__main__':
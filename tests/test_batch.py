@@ -0,0 +1,49 @@
+"""Batch mode run as a process, script is read from stdin."""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def run_batch(script: str, cwd: str) -> list:
+    """Run script through main.py --script - in cwd, return its json lines"""
+    env = {**os.environ, "PIPBOY_LANG": "en"}
+    env.pop("PIPBOY_NOTES_PASSPHRASE", None)
+    process = subprocess.run(
+        [sys.executable, MAIN, "--script", "-"], input=script, cwd=cwd, env=env,
+        capture_output=True, text=True, timeout=60,
+    )
+    return [json.loads(line) for line in process.stdout.splitlines()]
+
+
+class EmptyArgumentsTest(unittest.TestCase):
+    def test_empty_title_and_tag_do_not_read_next_lines(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            lines = run_batch(
+                'note-add "" body\n'
+                'note-add "Vault-Tec" body\n'
+                'note-add-tag "Vault-Tec" ""\n'
+                'notes-all\n',
+                cwd,
+            )
+            self.assertEqual([line["line"] for line in lines], [1, 2, 3, 4])
+            self.assertEqual([line["ok"] for line in lines], [False, True, False, True])
+            self.assertEqual([note["title"] for note in lines[3]["result"]], ["Vault-Tec"])
+            self.assertEqual(lines[3]["result"][0]["tags"], [])
+            with open(os.path.join(cwd, "notes.json"), encoding="utf-8") as f:
+                self.assertEqual(list(json.load(f)), ["Vault-Tec"])
+
+    def test_missing_address_is_reported_as_json_error(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            lines = run_batch('add "John Smith" 0501234567\ndelete-address "John Smith" home\n', cwd)
+            self.assertEqual([line["ok"] for line in lines], [True, False])
+            self.assertEqual(lines[1]["error"], "No address found with label 'home'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+"""Notes written to every supported format are read back unchanged."""
+
+import os
+import tempfile
+import unittest
+
+from app.classes.notes_io import FORMATS, read_notes, write_notes
+
+NOTES = {
+    "Vault-Tec": {"content": "gAAAAABk-ciphertext==", "tags": ["secret"], "encrypted": True},
+    "Plain": {"content": "Encrypted: yes\n---\n\\path", "tags": []},
+}
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_encrypted_note_stays_encrypted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for extension in FORMATS:
+                with self.subTest(extension=extension):
+                    path = os.path.join(directory, f"notes{extension}")
+                    self.assertEqual(write_notes(path, NOTES.items()), len(NOTES))
+                    self.assertEqual(dict(read_notes(path)), NOTES)
+
+
+if __name__ == "__main__":
+    unittest.main()